@@ -0,0 +1,56 @@
+"""Micro-benchmark of the per-chunk progress hook path.
+
+    python benchmarks/bench_hooks.py [--calls 200000]
+
+yt-dlp calls every progress hook once per received chunk, so their cost is
+paid hundreds of times a second per download.  This times the hooks the
+engine installs (``StageClock`` and ``ProgressReporter``) on synthetic
+``downloading`` updates, both on the throttled fast path and when every
+call emits an event, and reports nanoseconds per call.
+"""
+import argparse
+import time
+
+import standin  # noqa: F401  (puts the repo on sys.path)
+from downloader.jobs import Job
+from downloader.metrics import Metrics, StageClock
+from downloader.progress import ProgressReporter
+
+
+def _updates(calls):
+    total = 512 * 1024 ** 2
+    return [{'status': 'downloading', 'downloaded_bytes': total * i // calls, 'total_bytes': total,
+             'speed': 25e6, 'eta': 10} for i in range(calls)]
+
+
+def _time(hook, updates):
+    start = time.perf_counter()
+    for d in updates:
+        hook(d)
+    return (time.perf_counter() - start) / len(updates) * 1e9
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--calls', type=int, default=200000, help='hook calls per case (default: 200000)')
+    args = parser.parse_args(argv)
+    updates = _updates(args.calls)
+
+    cases = [
+        ('StageClock.progress_hook', StageClock(metrics=Metrics()).progress_hook),
+        ('ProgressReporter.progress_hook (throttled)', ProgressReporter(Job('bench')).progress_hook),
+        ('ProgressReporter.progress_hook (every call)', ProgressReporter(Job('bench'), interval=0).progress_hook),
+        ('ProgressReporter + listener (every call)',
+         ProgressReporter(Job('bench'), interval=0, listeners=[lambda event: None]).progress_hook),
+    ]
+    width = max(len(name) for name, _ in cases)
+    for name, hook in cases:
+        # Best of three, after a warm-up pass
+        _time(hook, updates[:1000])
+        best = min(_time(hook, updates) for _ in range(3))
+        print(f'{name:<{width}}  {best:8.0f} ns/call')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,239 @@
+"""End-to-end benchmark of metadata -> download -> merge -> deliver, fully offline.
+
+    python benchmarks/bench_pipeline.py [--sizes 8,64] [--concurrency 1,4] [--videos 4]
+                                        [--rate 20M] [--json results.json]
+
+A local stand-in site (``standin.py``) serves synthetic H.264/AAC streams
+and the ``YtdBench`` yt-dlp plugin plays the extractor, so the run needs no
+network.  Every (size, concurrency) scenario runs in a fresh subprocess
+with an empty data dir, so caches start cold and peak RSS is per scenario.
+Each video goes through the same calls the app makes: ``fetch_info``, a
+``download_job`` on the job queue, then a GET of the delivered file from
+the built-in file server.  The same videos are then requested a second
+time to measure the cached path.
+
+Reported per scenario: end-to-end latency (p50/p95), delivered MB/s,
+p50 of each stage from ``downloader.metrics``, cached latency, progress
+hook calls and the share of download time spent in them, and peak RSS of
+the process and of its ffmpeg children.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import standin  # also puts the repo and the yt-dlp plugin on sys.path
+
+_STAGES = ('metadata', 'queue', 'download', 'merge', 'publish', 'serve')
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def _parse_rate(text):
+    if not text:
+        return None
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    text = text.strip().upper()
+    return int(float(text[:-1]) * units[text[-1]]) if text[-1] in units else int(text)
+
+
+def _instrument_hooks(stats):
+    """Wrap every progress/postprocessor hook to count calls and time spent in them."""
+    from downloader.metrics import StageClock
+    from downloader.progress import ProgressReporter
+
+    lock = threading.Lock()
+
+    def wrap(cls, name):
+        original = getattr(cls, name)
+
+        def timed(self, d):
+            start = time.perf_counter()
+            try:
+                return original(self, d)
+            finally:
+                elapsed = time.perf_counter() - start
+                with lock:
+                    stats['calls'] += 1
+                    stats['seconds'] += elapsed
+
+        setattr(cls, name, timed)
+
+    for cls in (ProgressReporter, StageClock):
+        wrap(cls, 'progress_hook')
+        wrap(cls, 'postprocessor_hook')
+
+
+def _deliver(url):
+    # Drain the file from the file server like a browser would
+    nbytes = 0
+    with urllib.request.urlopen(url) as response:
+        while True:
+            chunk = response.read(1024 * 1024)
+            if not chunk:
+                return nbytes
+            nbytes += len(chunk)
+
+
+def _run_one(url, ffmpeg_path):
+    from downloader import download_job, fetch_info, get_delivery, get_job_queue
+
+    start = time.perf_counter()
+    fetch_info(url)
+    job = get_job_queue().submit(download_job, url, ffmpeg_path, label=url, block=True)
+    while not job.done:
+        time.sleep(0.01)
+    if job.error:
+        raise RuntimeError(job.error)
+    link = get_delivery().link(job.result['token'], job.result['filename'], host='127.0.0.1')
+    nbytes = _deliver(link)
+    return time.perf_counter() - start, nbytes
+
+
+def _round(urls, concurrency, ffmpeg_path):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(lambda url: _run_one(url, ffmpeg_path), urls))
+    return time.perf_counter() - started, [r[0] for r in results], sum(r[1] for r in results)
+
+
+def run_worker(spec):
+    """One scenario, inside its own process; prints a JSON result line."""
+    from downloader import get_ffmpeg_path, get_metrics
+
+    hooks = {'calls': 0, 'seconds': 0.0}
+    _instrument_hooks(hooks)
+    ffmpeg_path = get_ffmpeg_path()
+    urls = [standin.video_url(spec['base_url'], spec['size_mb'], f'{spec["run"]}-{n}')
+            for n in range(spec['videos'])]
+
+    wall, latencies, nbytes = _round(urls, spec['concurrency'], ffmpeg_path)
+    stages = get_metrics().summary()
+    hook_calls, hook_seconds = hooks['calls'], hooks['seconds']
+    _, cached, _ = _round(urls, spec['concurrency'], ffmpeg_path)
+
+    download_seconds = stages.get('download', {}).get('seconds') or 0
+    result = {
+        'size_mb': spec['size_mb'],
+        'concurrency': spec['concurrency'],
+        'videos': spec['videos'],
+        'wall_s': wall,
+        'e2e_p50_s': _percentile(latencies, 0.5),
+        'e2e_p95_s': _percentile(latencies, 0.95),
+        'delivered_bytes': nbytes,
+        'throughput_mb_s': nbytes / wall / 1024 ** 2,
+        'stages': {name: {k: stages[name][k] for k in ('count', 'p50', 'p95', 'throughput_p50')}
+                   for name in _STAGES if name in stages},
+        'cached_p50_s': _percentile(cached, 0.5),
+        'cached_p95_s': _percentile(cached, 0.95),
+        'hook_calls': hook_calls,
+        'hook_us_per_call': hook_seconds / hook_calls * 1e6 if hook_calls else None,
+        'hook_share': hook_seconds / download_seconds if download_seconds else None,
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform != 'darwin' else 1024 ** 2),
+        'children_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        / (1024 if sys.platform != 'darwin' else 1024 ** 2),
+    }
+    print(json.dumps(result))
+
+
+def run_scenario(base_url, size_mb, concurrency, videos, run_id):
+    data_dir = tempfile.mkdtemp(prefix='ytd-bench-')
+    env = dict(os.environ, YTD_DATA_DIR=data_dir, YTD_JOB_WORKERS=str(concurrency),
+               YTD_JOB_QUEUE_SIZE=str(max(videos, 16)), YTD_FILE_SERVER_PORT='0')
+    spec = {'base_url': base_url, 'size_mb': size_mb, 'concurrency': concurrency, 'videos': videos, 'run': run_id}
+    try:
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', json.dumps(spec)],
+                              env=env, capture_output=True, text=True, check=False)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f'scenario {size_mb} MB x{concurrency} failed:\n{proc.stderr[-2000:]}')
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _fmt(value, spec='.2f'):
+    return '-' if value is None else format(value, spec)
+
+
+def print_table(results):
+    header = (f"{'size':>6} {'conc':>4} {'e2e p50':>8} {'e2e p95':>8} {'MB/s':>7} {'meta':>6} {'dl':>6} "
+              f"{'merge':>6} {'serve':>6} {'cached':>7} {'hook us':>7} {'hook%':>6} {'RSS MB':>7} {'ffmpeg':>7}")
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        stage = lambda name: r['stages'].get(name, {}).get('p50')  # noqa: E731
+        print(f"{r['size_mb']:>4}MB {r['concurrency']:>4} {_fmt(r['e2e_p50_s']):>8} {_fmt(r['e2e_p95_s']):>8} "
+              f"{_fmt(r['throughput_mb_s'], '.1f'):>7} {_fmt(stage('metadata'), '.3f'):>6} "
+              f"{_fmt(stage('download')):>6} {_fmt(stage('merge')):>6} {_fmt(stage('serve'), '.3f'):>6} "
+              f"{_fmt(r['cached_p50_s'], '.3f'):>7} {_fmt(r['hook_us_per_call'], '.1f'):>7} "
+              f"{_fmt(r['hook_share'] and r['hook_share'] * 100, '.2f'):>6} "
+              f"{_fmt(r['rss_mb'], '.0f'):>7} {_fmt(r['children_rss_mb'], '.0f'):>7}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--sizes', default='8,64', help='video sizes in MB, comma separated (default: 8,64)')
+    parser.add_argument('--concurrency', default='1,4', help='parallel downloads, comma separated (default: 1,4)')
+    parser.add_argument('--videos', type=int, default=4, help='videos per scenario (default: 4)')
+    parser.add_argument('--rate', help='throttle each stand-in connection, e.g. 20M (bytes/s); default unthrottled')
+    parser.add_argument('--json', metavar='FILE', help='also write the results to FILE')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(json.loads(args.worker))
+        return 0
+
+    from downloader import get_ffmpeg_path
+    ffmpeg_path = get_ffmpeg_path()
+    if not ffmpeg_path:
+        print('FFmpeg is required to generate the synthetic media and to merge.', file=sys.stderr)
+        return 1
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    levels = [int(c) for c in args.concurrency.split(',')]
+    media = {size: standin.make_media(size, ffmpeg_path) for size in sizes}
+    server, base_url = standin.start_standin(media, rate=_parse_rate(args.rate))
+
+    results = []
+    run_id = f'{int(time.time())}'
+    try:
+        for size in sizes:
+            for concurrency in levels:
+                results.append(run_scenario(base_url, size, concurrency, args.videos, run_id))
+                print(f'  done: {size} MB x{concurrency}', file=sys.stderr)
+    finally:
+        server.shutdown()
+
+    print_table(results)
+    if args.json:
+        import yt_dlp.version
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'yt_dlp': yt_dlp.version.__version__,
+                'rate': args.rate,
+                'results': results,
+            }, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
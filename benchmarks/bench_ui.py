@@ -0,0 +1,92 @@
+"""Script-run timings of the Streamlit app (``yt_downloader.py``), offline.
+
+    python benchmarks/bench_ui.py [--runs 20]
+
+Runs the app headless with ``streamlit.testing`` against the stand-in site
+and reports how long Streamlit takes to execute the script: the first run
+of a session, an idle rerun (what every widget interaction and progress
+poll costs), a search for an uncached video and a search for a cached one.
+
+Like a real server, all runs share one compiled copy of the script (AppTest
+on its own recompiles it every run, which would swamp the script's own cost).
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+# Before ``downloader.config`` is imported: scratch data dir, any free port
+os.environ['YTD_DATA_DIR'] = tempfile.mkdtemp(prefix='ytd-bench-ui-')
+os.environ['YTD_FILE_SERVER_PORT'] = '0'
+
+import standin  # noqa: E402  (puts the repo and the yt-dlp plugin on sys.path)
+from downloader import get_ffmpeg_path  # noqa: E402
+
+APP = os.path.join(standin.ROOT, 'yt_downloader.py')
+
+
+def _timed_run(at):
+    start = time.perf_counter()
+    at.run()
+    elapsed = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    return elapsed
+
+
+def _summary(values):
+    values = sorted(values)
+    return f'p50 {statistics.median(values) * 1000:7.1f} ms   p95 {values[int(0.95 * (len(values) - 1))] * 1000:7.1f} ms'
+
+
+def _share_script_cache():
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    cache = app_test.ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: cache
+
+
+def main(argv=None):
+    from streamlit.testing.v1 import AppTest
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--runs', type=int, default=20, help='samples per measurement (default: 20)')
+    args = parser.parse_args(argv)
+    _share_script_cache()
+
+    media = {8: standin.make_media(8, get_ffmpeg_path())}
+    server, base_url = standin.start_standin(media)
+    try:
+        first = []
+        for _ in range(min(args.runs, 5)):
+            first.append(_timed_run(AppTest.from_file(APP, default_timeout=60)))
+
+        at = AppTest.from_file(APP, default_timeout=60)
+        at.run()
+        idle = [_timed_run(at) for _ in range(args.runs)]
+
+        search, cached = [], []
+        for n in range(args.runs):
+            url = standin.video_url(base_url, 8, f'ui-{time.time_ns()}-{n}')
+            at.text_input[0].input(url)
+            search.append(_timed_run(at))
+            # Same video again from a fresh session: served from the metadata cache
+            other = AppTest.from_file(APP, default_timeout=60)
+            other.run()
+            other.text_input[0].input(url)
+            cached.append(_timed_run(other))
+    finally:
+        server.shutdown()
+        shutil.rmtree(os.environ['YTD_DATA_DIR'], ignore_errors=True)
+
+    print(f'first run       {_summary(first)}')
+    print(f'idle rerun      {_summary(idle)}')
+    print(f'search (cold)   {_summary(search)}')
+    print(f'search (cached) {_summary(cached)}')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,180 @@
+"""Offline stand-in for a video site, shared by the benchmarks.
+
+Serves synthetic, separately muxed video (H.264 MP4) and audio (AAC M4A)
+streams from a local HTTP server with Range support, plus one
+``/bench/<id>/info.json`` document per video that the ``YtdBench`` yt-dlp
+plugin (``benchmarks/yt_dlp_plugins``) turns into an info dict.  Video ids
+look like ``64mb-3``: the size of the video in MB, then any suffix to make
+the id (and therefore the cache keys) unique.
+
+The media is generated once with the detected ffmpeg: a 10 s clip is
+encoded and then stream-copied in a loop up to the requested size, which
+takes well under a second even for large files.
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+# The repo for ``import downloader``, this directory for the yt-dlp plugin;
+# both must be importable before the first YoutubeDL is created
+for _path in (ROOT, BENCH_DIR):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+MEDIA_DIR = os.environ.get('YTD_BENCH_MEDIA') or os.path.join(tempfile.gettempdir(), 'yt-downloader-bench-media')
+
+_ID_RE = re.compile(r'^(\d+)mb(?:-[\w-]+)?$')
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_BASE_SECONDS = 10
+
+
+def _ffmpeg(ffmpeg, *args):
+    subprocess.run([ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', *args], check=True)
+
+
+def make_media(size_mb, ffmpeg, media_dir=MEDIA_DIR):
+    """Return ``(video_path, audio_path)`` for a video of about ``size_mb`` MB, generating it once."""
+    os.makedirs(media_dir, exist_ok=True)
+    base_video = os.path.join(media_dir, 'base.mp4')
+    base_audio = os.path.join(media_dir, 'base.m4a')
+    if not os.path.exists(base_video):
+        _ffmpeg(ffmpeg, '-f', 'lavfi', '-i', 'testsrc2=size=1280x720:rate=30', '-t', str(_BASE_SECONDS),
+                '-c:v', 'libx264', '-preset', 'ultrafast', '-qp', '0', '-pix_fmt', 'yuv420p',
+                base_video + '.tmp.mp4')
+        os.replace(base_video + '.tmp.mp4', base_video)
+    if not os.path.exists(base_audio):
+        _ffmpeg(ffmpeg, '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=44100', '-t', str(_BASE_SECONDS),
+                '-c:a', 'aac', '-b:a', '128k', base_audio + '.tmp.m4a')
+        os.replace(base_audio + '.tmp.m4a', base_audio)
+
+    video = os.path.join(media_dir, f'{size_mb}mb.mp4')
+    audio = os.path.join(media_dir, f'{size_mb}mb.m4a')
+    if not (os.path.exists(video) and os.path.exists(audio)):
+        seconds = _duration(size_mb, media_dir)
+        for base, target in ((base_video, video), (base_audio, audio)):
+            _ffmpeg(ffmpeg, '-stream_loop', '-1', '-i', base, '-t', f'{seconds:.2f}', '-c', 'copy',
+                    '-movflags', '+faststart', target + '.tmp' + os.path.splitext(target)[1])
+            os.replace(target + '.tmp' + os.path.splitext(target)[1], target)
+    return video, audio
+
+
+def _duration(size_mb, media_dir=MEDIA_DIR):
+    # Seconds of the base clip's bitrate that make up size_mb
+    bytes_per_second = os.path.getsize(os.path.join(media_dir, 'base.mp4')) / _BASE_SECONDS
+    return max(size_mb * 1024 ** 2 / bytes_per_second, 1.0)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    media = None  # {size_mb: (video_path, audio_path)}, set per server
+    files = None  # {basename: path} of everything in media
+    rate = None  # bytes per second per connection, None for unthrottled
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):
+        parts = self.path.split('?', 1)[0].strip('/').split('/')
+        if len(parts) == 3 and parts[0] == 'bench' and parts[2] == 'info.json':
+            self._send_info(parts[1])
+        elif len(parts) == 2 and parts[0] == 'media':
+            self._send_media(parts[1])
+        else:
+            self.send_error(404)
+
+    def _send_info(self, video_id):
+        m = _ID_RE.match(video_id)
+        if not m or int(m.group(1)) not in self.media:
+            self.send_error(404)
+            return
+        video, audio = self.media[int(m.group(1))]
+        base = f'http://{self.headers["Host"]}/media'
+        duration = round(_duration(int(m.group(1)), os.path.dirname(video)), 2)
+        info = {
+            'id': video_id,
+            'title': f'Bench {video_id}',
+            'uploader': 'ytd-bench',
+            'duration': duration,
+            'view_count': 0,
+            'formats': [
+                {'format_id': '137', 'url': f'{base}/{os.path.basename(video)}', 'ext': 'mp4',
+                 'vcodec': 'avc1.64001f', 'acodec': 'none', 'width': 1280, 'height': 720, 'fps': 30,
+                 'filesize': os.path.getsize(video), 'tbr': os.path.getsize(video) * 8 / 1000 / duration},
+                {'format_id': '140', 'url': f'{base}/{os.path.basename(audio)}', 'ext': 'm4a',
+                 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 128,
+                 'filesize': os.path.getsize(audio), 'tbr': 128},
+            ],
+        }
+        body = json.dumps(info).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_media(self, name):
+        path = self.files.get(name)
+        if not path:
+            self.send_error(404)
+            return
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            start, end, status = 0, size - 1, 200
+            m = _RANGE_RE.match(self.headers.get('Range', '').strip())
+            if m and m.group(1):
+                start = int(m.group(1))
+                end = min(int(m.group(2)), size - 1) if m.group(2) else end
+                status = 206
+            length = end - start + 1
+            self.send_response(status)
+            self.send_header('Content-Type', 'video/mp4' if name.endswith('.mp4') else 'audio/mp4')
+            self.send_header('Content-Length', str(length))
+            self.send_header('Accept-Ranges', 'bytes')
+            if status == 206:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.end_headers()
+            try:
+                if self.rate:
+                    self._send_throttled(f, start, length)
+                else:
+                    self.connection.sendfile(f, offset=start, count=length)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    def _send_throttled(self, f, start, length):
+        f.seek(start)
+        chunk = max(self.rate // 20, 16 * 1024)
+        began = time.monotonic()
+        sent = 0
+        while sent < length:
+            data = f.read(min(chunk, length - sent))
+            if not data:
+                break
+            self.wfile.write(data)
+            sent += len(data)
+            ahead = sent / self.rate - (time.monotonic() - began)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+def start_standin(media, rate=None, host='127.0.0.1', port=0):
+    """Serve ``media`` (``{size_mb: (video, audio)}``) and return ``(server, base_url)``."""
+    files = {os.path.basename(path): path for pair in media.values() for path in pair}
+    handler = type('StandInHandler', (_Handler,), {'media': dict(media), 'files': files, 'rate': rate})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='ytd-bench-standin', daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+def video_url(base_url, size_mb, suffix):
+    return f'{base_url}/bench/{size_mb}mb-{suffix}'
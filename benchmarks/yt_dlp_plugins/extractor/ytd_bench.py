@@ -0,0 +1,15 @@
+"""yt-dlp extractor plugin for the benchmark stand-in site (see ``benchmarks/standin.py``).
+
+yt-dlp picks it up from any ``yt_dlp_plugins`` package on ``sys.path``; the
+benchmarks put ``benchmarks/`` there, so the app never sees it otherwise.
+"""
+from yt_dlp.extractor.common import InfoExtractor
+
+
+class YtdBenchIE(InfoExtractor):
+    IE_NAME = 'ytd-bench'
+    _VALID_URL = r'https?://127\.0\.0\.1:\d+/bench/(?P<id>[\w-]+)/?$'
+
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        return self._download_json(f"{url.rstrip('/')}/info.json", video_id)
@@ -0,0 +1,47 @@
+"""Download engine behind the Streamlit app (``yt_downloader.py``).
+
+Importable without Streamlit::
+
+    from downloader import download, fetch_info
+    info = fetch_info(url)
+    path = download(url, output_dir='videos')
+
+or from the shell: ``python -m downloader URL [URL ...] -o videos -j 4``.
+"""
+from .bandwidth import BandwidthScheduler, get_bandwidth
+from .batch import Batch, expand_urls, get_batch, start_batch
+from .delivery import DeliveryStore, get_delivery
+from .engine import build_download_opts, download, download_job
+from .export import Export, Exporter, get_exporter
+from .ffmpeg import find_ffmpeg, get_ffmpeg_path, has_encoder
+from .formats import clip_option, format_options, option_label, parse_time, plan_option
+from .governor import MemoryBudget, get_memory_budget
+from .jobs import Job, JobQueue, QueueFull, get_job_queue
+from .lookup import Lookup, LookupPool, get_lookup_pool, start_lookup
+from .metadata import (
+    MetadataCache, download_with_cache, fetch_info, get_metadata_cache, normalize_url, preload, video_key,
+)
+from .metrics import Metrics, StageClock, get_metrics
+from .progress import ProgressEvent, ProgressReporter, format_time, subscribe, unsubscribe
+from .results import ResultCache, get_result_cache, result_key
+from .state import LocalStore, RedisStore, get_state
+from .thumbnails import ThumbnailCache, get_thumbnails, pick_thumbnail
+
+__all__ = [
+    'BandwidthScheduler', 'get_bandwidth',
+    'Batch', 'expand_urls', 'get_batch', 'start_batch',
+    'DeliveryStore', 'get_delivery',
+    'build_download_opts', 'download', 'download_job',
+    'Export', 'Exporter', 'get_exporter',
+    'find_ffmpeg', 'get_ffmpeg_path', 'has_encoder',
+    'clip_option', 'format_options', 'option_label', 'parse_time', 'plan_option',
+    'MemoryBudget', 'get_memory_budget',
+    'Job', 'JobQueue', 'QueueFull', 'get_job_queue',
+    'Lookup', 'LookupPool', 'get_lookup_pool', 'start_lookup',
+    'MetadataCache', 'download_with_cache', 'fetch_info', 'get_metadata_cache', 'normalize_url', 'preload', 'video_key',
+    'Metrics', 'StageClock', 'get_metrics',
+    'ProgressEvent', 'ProgressReporter', 'format_time', 'subscribe', 'unsubscribe',
+    'ResultCache', 'get_result_cache', 'result_key',
+    'LocalStore', 'RedisStore', 'get_state',
+    'ThumbnailCache', 'get_thumbnails', 'pick_thumbnail',
+]
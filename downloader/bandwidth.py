@@ -0,0 +1,165 @@
+"""Shared bandwidth scheduler.
+
+Every running download gets a :class:`Share` of the uplink, enforced by a
+token bucket in its progress hook (yt-dlp calls the hook from the thread
+that just received the data, so sleeping there slows that transfer down,
+fragments included).  Shares are re-balanced whenever a download starts or
+ends: the global limit is split evenly between sessions, no session gets
+more than the per-session limit, whatever a capped session leaves unused
+goes to the others, and each session's part is split evenly between its
+jobs.  Batch items count toward the session that started the batch;
+downloads without a session (the CLI) count as one session together.  A
+limit of 0 means unlimited.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from . import config
+
+log = logging.getLogger(__name__)
+
+# Seconds of transfer history the reported speed is averaged over
+_SPEED_WINDOW = 3
+
+
+class Share:
+    """One download's slice of the bandwidth; ``rate`` is None when unlimited."""
+
+    def __init__(self, scheduler, job):
+        self.scheduler = scheduler
+        self.job = job
+        self.owner = job.owner if job is not None else None
+        self.rate = None
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self._seen = {}  # filename -> bytes already accounted for
+        self._moved = 0
+        self._window = deque()  # (time, bytes moved) over the last few seconds
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        self.rate = rate
+        if self.job is not None:
+            self.job.update(rate_limit=rate)
+
+    def progress_hook(self, d):
+        if d['status'] != 'downloading' or self.rate is None:
+            return
+        done = d.get('downloaded_bytes') or 0
+        key = d.get('tmpfilename') or d.get('filename')
+        with self._lock:
+            # Restarts (a new file, a resumed transfer) move the counter backwards
+            delta = max(done - self._seen.get(key, done), 0)
+            self._seen[key] = done
+        self.consume(delta)
+
+        # yt-dlp measures speed before the throttle sleeps; report what the
+        # transfer actually achieves to the hooks that run after this one
+        speed = self._effective_speed(delta)
+        if speed:
+            d['speed'] = speed
+            total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            if total:
+                d['eta'] = max(total - done, 0) / speed
+
+    def _effective_speed(self, delta):
+        with self._lock:
+            now = time.monotonic()
+            self._moved += delta
+            self._window.append((now, self._moved))
+            while now - self._window[0][0] > _SPEED_WINDOW:
+                self._window.popleft()
+            start, moved = self._window[0]
+        return (self._moved - moved) / (now - start) if now - start > 0.5 else None
+
+    def consume(self, nbytes):
+        """Take ``nbytes`` from the bucket, sleeping until the rate allows it."""
+        rate = self.rate
+        if not rate or nbytes <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            # At most one second's worth of burst
+            self._tokens = min(self._tokens + (now - self._last) * rate, rate) - nbytes
+            self._last = now
+            wait = -self._tokens / rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+    def postprocessor_hook(self, d):
+        # Merging / converting uses no bandwidth: hand the share back early
+        if d['status'] == 'started':
+            self.release()
+
+    def release(self):
+        self.scheduler.unregister(self)
+
+
+class BandwidthScheduler:
+    """Splits ``total_rate`` fairly between sessions and jobs (bytes/s, 0 = unlimited)."""
+
+    def __init__(self, total_rate, session_rate):
+        self.total_rate = total_rate
+        self.session_rate = session_rate
+        self._shares = []
+        self._lock = threading.Lock()
+
+    def register(self, job=None):
+        """Start accounting a download for ``job`` (may be None) and return its :class:`Share`."""
+        share = Share(self, job)
+        with self._lock:
+            self._shares.append(share)
+            self._rebalance()
+        return share
+
+    def unregister(self, share):
+        with self._lock:
+            if share in self._shares:
+                self._shares.remove(share)
+                share.set_rate(None)
+                self._rebalance()
+
+    def _rebalance(self):
+        sessions = {}
+        for share in self._shares:
+            sessions.setdefault(share.owner, []).append(share)
+        session_cap = self.session_rate or None
+        if not self.total_rate:
+            allocation = {owner: session_cap for owner in sessions}
+        else:
+            # Max-min fair: capped sessions take their cap, the rest split what is left
+            allocation = {}
+            remaining = self.total_rate
+            pending = list(sessions)
+            while pending:
+                fair = remaining / len(pending)
+                capped = [owner for owner in pending if session_cap and session_cap < fair]
+                if not capped:
+                    for owner in pending:
+                        allocation[owner] = fair
+                    break
+                for owner in capped:
+                    allocation[owner] = session_cap
+                    remaining -= session_cap
+                    pending.remove(owner)
+        for owner, shares in sessions.items():
+            rate = allocation[owner]
+            for share in shares:
+                share.set_rate(rate / len(shares) if rate else None)
+        if self.total_rate or self.session_rate:
+            log.debug('Bandwidth re-balanced over %d downloads in %d sessions', len(self._shares), len(sessions))
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_bandwidth():
+    """Return the process-wide :class:`BandwidthScheduler`."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = BandwidthScheduler(config.BANDWIDTH_LIMIT, config.SESSION_BANDWIDTH_LIMIT)
+        return _scheduler
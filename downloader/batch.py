@@ -0,0 +1,293 @@
+"""Batch mode: playlists, channels and pasted lists of links.
+
+A batch expands its input with flat (entry-list only) extraction, fetches
+metadata for the entries on a small thread pool and feeds them into the
+regular job queue as they resolve, so downloads start while later entries
+are still being looked up and the worker pool bounds the parallelism.  Each
+finished file is linked into one delivery entry as soon as its job is done
+(a long batch outlives the entries of its first files), and the file server
+streams that entry as a ZIP once every item is done.
+
+Batch records are mirrored to the shared state store like job records, so
+a refreshed ``?batch=`` page that lands on another app process still finds
+its batch, and the one-batch-per-session limit holds across processes.
+"""
+import logging
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import config
+from .delivery import get_delivery
+from .engine import download_job
+from .jobs import QueueFull, get_job_queue
+from .metadata import fetch_info, video_key
+from .state import get_state
+
+log = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Records of unfinished batches expire after this
+_RUNNING_TTL = 24 * 60 * 60
+# A running batch re-saves its record this often (seconds) ...
+_HEARTBEAT_INTERVAL = 30
+# ... and counts as done when its record is older than this
+_STALE_AFTER = 4 * _HEARTBEAT_INTERVAL
+
+
+def expand_urls(text, limit=None):
+    """Turn pasted text (links, playlist or channel URLs) into video URLs."""
+    limit = limit or config.BATCH_MAX_ITEMS
+    urls = []
+    for url in _WHITESPACE_RE.split(text.strip()):
+        if not url:
+            continue
+        if video_key(url).startswith('youtube:') and 'list=' not in url:
+            # A plain video link needs no extractor round-trip here
+            urls.append(url)
+        else:
+            urls.extend(_flat_entries(url, limit - len(urls)))
+        if len(urls) >= limit:
+            break
+    return list(dict.fromkeys(urls))[:limit]
+
+
+def _flat_entries(url, limit, depth=0):
+    import yt_dlp
+
+    opts = {'quiet': True, 'no_warnings': True, 'extract_flat': 'in_playlist', 'playlistend': limit}
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+    if info.get('_type') not in ('playlist', 'multi_video'):
+        return [info.get('webpage_url') or url]
+
+    urls = []
+    for entry in info.get('entries') or []:
+        entry_url = entry and (entry.get('url') or entry.get('webpage_url'))
+        if not entry_url:
+            continue
+        if entry.get('ie_key') == 'YoutubeTab' and depth == 0:
+            # Channel pages list their tabs (Videos, Shorts...) as playlists
+            urls.extend(_flat_entries(entry_url, limit - len(urls), depth + 1))
+        else:
+            urls.append(entry_url)
+        if len(urls) >= limit:
+            break
+    return urls[:limit]
+
+
+class BatchItem:
+    FIELDS = ('url', 'title', 'job_id', 'error', 'bundled')
+
+    def __init__(self, url):
+        self.url = url
+        self.title = url
+        self.job_id = None
+        self.error = None
+        self.bundled = False  # whether the file made it into the batch's ZIP
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+
+class Batch:
+    """A set of downloads started together and delivered as one ZIP."""
+
+    # What is shared with other processes (see :meth:`to_dict`)
+    FIELDS = ('id', 'owner', 'created', 'done', 'bundle', 'missing', 'heartbeat')
+
+    def __init__(self, urls, owner=None):
+        self.id = uuid.uuid4().hex
+        self.owner = owner  # session that started the batch, if any
+        self.items = [BatchItem(url) for url in urls]
+        self.created = time.time()
+        self.done = False
+        # {'token', 'filename', 'count', 'server', 'public_server'} once every
+        # item is done; the server keys as in download_job's result
+        self.bundle = None
+        self.missing = []  # titles of items that are not in the ZIP
+        self.heartbeat = None  # when the record was last written to the state store
+        self.remote = False  # a read-only copy of a batch run by another process
+        self._bundle_token = None
+        self._save_lock = threading.Lock()
+
+    def jobs(self):
+        queue = get_job_queue()
+        return [queue.get(item.job_id) if item.job_id else None for item in self.items]
+
+    def to_dict(self):
+        record = {name: getattr(self, name) for name in self.FIELDS}
+        record['items'] = [item.to_dict() for item in self.items]
+        return record
+
+    @classmethod
+    def from_dict(cls, record):
+        batch = cls([])
+        for name in cls.FIELDS:
+            setattr(batch, name, record.get(name))
+        for fields in record.get('items') or ():
+            item = BatchItem(fields['url'])
+            for name in BatchItem.FIELDS:
+                setattr(item, name, fields.get(name))
+            batch.items.append(item)
+        batch.remote = True
+        if not batch.done and time.time() - (batch.heartbeat or batch.created) > _STALE_AFTER:
+            # Whatever process ran it is gone, and so is the ZIP it was filling
+            batch.done = True
+            batch.missing = [item.title for item in batch.items]
+            for item in batch.items:
+                item.bundled = False
+        return batch
+
+    def save(self):
+        """Write the record to the state store."""
+        # Serialized, so an older snapshot never overwrites a newer one
+        with self._save_lock:
+            self.heartbeat = time.time()
+            try:
+                get_state().put('batch', self.id, self.to_dict(),
+                                ttl=config.DELIVERY_TTL if self.done else _RUNNING_TTL)
+            except Exception:
+                log.warning('Could not save batch %s to the state store', self.id, exc_info=True)
+
+
+_batches = {}
+_batches_lock = threading.Lock()
+_heartbeat = None
+
+
+def start_batch(urls, ffmpeg_path=None, owner=None):
+    """Start downloading ``urls`` in the background and return the :class:`Batch`.
+
+    Its jobs count against ``owner``'s (the session's) job limit, and an
+    owner may run at most ``SESSION_MAX_BATCHES`` batches at a time; past
+    that :class:`~downloader.jobs.QueueFull` is raised.
+    """
+    batch = Batch(urls, owner)
+    with _batches_lock:
+        cutoff = time.time() - config.DELIVERY_TTL
+        for batch_id in [b.id for b in _batches.values() if b.done and b.created < cutoff]:
+            del _batches[batch_id]
+    if owner is not None and config.SESSION_MAX_BATCHES:
+        _claim(batch)
+    else:
+        batch.save()
+    global _heartbeat
+    with _batches_lock:
+        _batches[batch.id] = batch
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=_beat, name='ytd-batch-heartbeat', daemon=True)
+            _heartbeat.start()
+    threading.Thread(target=_run_batch, args=(batch, ffmpeg_path), name=f'ytd-batch-{batch.id[:8]}',
+                     daemon=True).start()
+    return batch
+
+
+def _beat():
+    # Keeps the records of this process's running batches fresh, see Batch.from_dict
+    while True:
+        time.sleep(_HEARTBEAT_INTERVAL)
+        with _batches_lock:
+            running = [b for b in _batches.values() if not b.done]
+        for batch in running:
+            batch.save()
+
+
+def _claim(batch):
+    # The owner's batches are listed in the store, so every process sees them
+    store = get_state()
+    with store.lock(f'batches-{batch.owner}'):
+        try:
+            listed = store.get('batch-owner', batch.owner) or []
+        except Exception:
+            log.warning('Could not read the batches of %s from the state store', batch.owner, exc_info=True)
+            listed = []
+        active = [batch_id for batch_id in listed if (b := get_batch(batch_id)) and not b.done]
+        if len(active) >= config.SESSION_MAX_BATCHES:
+            raise QueueFull('Your previous batch is still running')
+        batch.save()
+        try:
+            store.put('batch-owner', batch.owner, active + [batch.id], ttl=_RUNNING_TTL)
+        except Exception:
+            log.warning('Could not save the batches of %s to the state store', batch.owner, exc_info=True)
+
+
+def get_batch(batch_id):
+    """The :class:`Batch` with ``batch_id``; a ``remote`` copy if another process runs it, or None."""
+    with _batches_lock:
+        batch = _batches.get(batch_id)
+    if batch is None:
+        try:
+            record = get_state().get('batch', batch_id)
+        except Exception:
+            log.warning('Could not read batch %s from the state store', batch_id, exc_info=True)
+            record = None
+        batch = Batch.from_dict(record) if record else None
+    return batch
+
+
+def _download_item(job, batch, item, ffmpeg_path):
+    result = download_job(job, item.url, ffmpeg_path)
+    store = get_delivery().store
+    path = store.resolve(result['token'], result['filename'])
+    try:
+        if path:
+            store.add_to_bundle(batch._bundle_token, path)
+            item.bundled = True
+            batch.save()
+    except OSError:
+        log.exception('Could not add %s to batch %s', path, batch.id)
+    return result
+
+
+def _submit(queue, batch, item, ffmpeg_path):
+    # Waits while the session is at its job limit or only reserved slots are
+    # left, which paces the batch without starving single downloads
+    while True:
+        try:
+            return queue.submit(_download_item, batch, item, ffmpeg_path, label=item.title, owner=batch.owner,
+                                reserve=config.BATCH_QUEUE_RESERVE)
+        except QueueFull:
+            get_delivery().store.touch(batch._bundle_token)
+            time.sleep(1)
+
+
+def _run_batch(batch, ffmpeg_path):
+    queue = get_job_queue()
+    store = get_delivery().store
+    try:
+        batch._bundle_token = store.open_bundle()
+        with ThreadPoolExecutor(config.BATCH_WORKERS, thread_name_prefix='ytd-batch-meta') as pool:
+            futures = {pool.submit(fetch_info, item.url): item for item in batch.items}
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    info = future.result()
+                except Exception:
+                    item.error = 'Failed to fetch metadata'
+                    batch.save()
+                    continue
+                item.title = info.get('title') or item.url
+                item.job_id = _submit(queue, batch, item, ffmpeg_path).id
+                batch.save()
+
+        while not all(job.done for job in batch.jobs() if job):
+            # Files arrive one by one; keep the entry alive until the last one
+            store.touch(batch._bundle_token)
+            time.sleep(1)
+
+        count = sum(1 for item in batch.items if item.bundled)
+        if count:
+            delivery = get_delivery()
+            batch.bundle = {'token': batch._bundle_token, 'filename': f'yt-batch-{batch.id[:8]}.zip', 'count': count,
+                            'server': delivery.server_url(),
+                            'public_server': (delivery.server and config.FILE_SERVER_URL) or None}
+    except Exception:
+        log.exception('Batch %s failed', batch.id)
+    finally:
+        batch.missing = [item.title for item in batch.items if not item.bundled]
+        batch.done = True
+        batch.save()
@@ -0,0 +1,132 @@
+"""Command-line interface: ``python -m downloader URL [URL ...]``.
+
+Runs the same engine as the Streamlit app (metadata cache, result cache,
+merge), without the Streamlit runtime.  Playlist and channel URLs are
+expanded like in the app's batch mode.
+"""
+import argparse
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import config
+from .batch import expand_urls
+from .engine import download
+from .export import Export, get_exporter
+from .formats import audio_option, best_option, clip_option, height_option, parse_time
+from .ffmpeg import get_ffmpeg_path
+from .jobs import Job
+from .progress import ProgressReporter, format_eta, format_speed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m downloader',
+        description='Download videos (and playlists/channels) as MP4 or audio.')
+    parser.add_argument('urls', nargs='*', metavar='URL', help='video, playlist or channel URL')
+    parser.add_argument('-i', '--input-file', metavar='FILE',
+                        help="read more URLs from FILE, one per line ('-' for stdin)")
+    parser.add_argument('-o', '--output-dir', default='.', metavar='DIR',
+                        help='where finished files are written (default: current directory)')
+    parser.add_argument('-f', '--quality', default='best', metavar='Q',
+                        help="'best' (default), a max height such as 720, 'audio' for M4A audio only, "
+                             "or an audio codec and bitrate such as mp3:192 or opus:128")
+    parser.add_argument('--clip', metavar='FROM-TO',
+                        help='download only this part of each video, e.g. 1:30-2:00')
+    parser.add_argument('-j', '--jobs', type=int, default=config.JOB_WORKERS, metavar='N',
+                        help=f'downloads to run at the same time (default: {config.JOB_WORKERS})')
+    parser.add_argument('--max-items', type=int, default=config.BATCH_MAX_ITEMS, metavar='N',
+                        help=f'max videos taken from the input (default: {config.BATCH_MAX_ITEMS})')
+    parser.add_argument('--export', action='store_true',
+                        help='upload finished files to YTD_EXPORT_TARGET and print their links instead')
+    parser.add_argument('-q', '--quiet', action='store_true', help='only print finished files and errors')
+    args = parser.parse_args(argv)
+
+    if args.input_file:
+        if args.input_file == '-':
+            # Not closed: it is the process's stdin
+            args.urls += _read_urls(sys.stdin)
+        else:
+            with open(args.input_file, encoding='utf-8') as f:
+                args.urls += _read_urls(f)
+    if not args.urls:
+        parser.error('no URLs given')
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.export and not config.EXPORT_TARGET:
+        parser.error('--export needs YTD_EXPORT_TARGET (a directory or s3://bucket/prefix)')
+    if args.quality == 'best':
+        args.option = best_option()
+    elif args.quality == 'audio':
+        args.option = audio_option()
+    elif args.quality.rstrip('p').isdigit():
+        args.option = height_option(int(args.quality.rstrip('p')))
+    else:
+        codec, _, bitrate = args.quality.lower().partition(':')
+        try:
+            if bitrate and not bitrate.rstrip('k').isdigit():
+                raise ValueError(f'invalid bitrate {bitrate!r}')
+            args.option = audio_option(codec, int(bitrate.rstrip('k')) if bitrate else None)
+        except ValueError as e:
+            parser.error(f'invalid --quality {args.quality!r}: {e}')
+    if args.clip:
+        start, sep, end = args.clip.partition('-')
+        try:
+            if not sep:
+                raise ValueError('expected FROM-TO')
+            args.option = clip_option(args.option, parse_time(start), parse_time(end))
+        except ValueError as e:
+            parser.error(f'invalid --clip {args.clip!r}: {e}')
+    return args
+
+
+def _read_urls(f):
+    return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def _print_progress(label):
+    def listener(event):
+        if event.stage == 'download':
+            print(f'{label}: {event.progress * 100:5.1f}%  {format_speed(event.speed)}  ETA {format_eta(event.eta)}',
+                  file=sys.stderr)
+        elif event.stage == 'merge':
+            how = {'remux': ' (stream copy)', 'transcode-audio': ' (converting audio)'}.get(event.detail, '')
+            print(f'{label}: merging video & audio{how}...', file=sys.stderr)
+        elif event.stage == 'convert':
+            print(f'{label}: converting audio...', file=sys.stderr)
+    return listener
+
+
+def _download_one(url, args, ffmpeg_path):
+    listeners = [] if args.quiet else [_print_progress(url)]
+    reporter = ProgressReporter(Job(url), listeners=listeners)
+    if not args.export:
+        return download(url, args.option, output_dir=args.output_dir, ffmpeg_path=ffmpeg_path, reporter=reporter)
+    export = Export(get_exporter(), reporter.job)
+    try:
+        path = download(url, args.option, ffmpeg_path=ffmpeg_path, reporter=reporter, export=export)
+    except BaseException:
+        export.abort()
+        raise
+    return export.finish(path)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s: %(message)s')
+
+    urls = expand_urls(' '.join(args.urls), limit=args.max_items)
+    ffmpeg_path = get_ffmpeg_path()
+    if not ffmpeg_path:
+        print('warning: FFmpeg not found. Merging capabilities are limited.', file=sys.stderr)
+
+    failures = 0
+    with ThreadPoolExecutor(args.jobs) as pool:
+        futures = {pool.submit(_download_one, url, args, ffmpeg_path): url for url in urls}
+        for n, future in enumerate(as_completed(futures), 1):
+            try:
+                print(f'[{n}/{len(urls)}] {future.result()}')
+            except Exception as e:
+                failures += 1
+                print(f'[{n}/{len(urls)}] FAILED {futures[future]}: {e}', file=sys.stderr)
+    return 1 if failures else 0
@@ -0,0 +1,95 @@
+"""Runtime settings, read once from ``YTD_*`` environment variables."""
+import os
+import tempfile
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    try:
+        return int(value) if value else default
+    except ValueError:
+        return default
+
+
+# Root for everything the app keeps on disk between script reruns
+DATA_DIR = os.environ.get('YTD_DATA_DIR') or os.path.join(tempfile.gettempdir(), 'yt-downloader')
+
+# Where the FFmpeg location and capabilities are remembered between restarts
+FFMPEG_CACHE = os.path.join(DATA_DIR, 'ffmpeg.json')
+
+# Finished files waiting to be fetched by the browser
+DELIVERY_DIR = os.path.join(DATA_DIR, 'delivery')
+DELIVERY_TTL = _env_int('YTD_DELIVERY_TTL', 60 * 60)
+
+# Small built-in HTTP server that streams delivered files from disk
+FILE_SERVER_HOST = os.environ.get('YTD_FILE_SERVER_HOST', '0.0.0.0')
+FILE_SERVER_PORT = _env_int('YTD_FILE_SERVER_PORT', 8502)
+# Public base URL of the file server (set this when running behind a proxy)
+FILE_SERVER_URL = os.environ.get('YTD_FILE_SERVER_URL', '').rstrip('/')
+
+# Finished downloads shared between users, keyed by video + format
+RESULT_CACHE_DIR = os.path.join(DATA_DIR, 'results')
+RESULT_CACHE_MAX_BYTES = _env_int('YTD_RESULT_CACHE_SIZE', 10 * 1024 ** 3)
+# Partial downloads are kept this long so a retried job can resume them
+WORK_DIR_TTL = _env_int('YTD_WORK_DIR_TTL', 24 * 60 * 60)
+
+# Transfer tuning: parallel fragments (DASH/HLS), HTTP range size and retries
+FRAGMENT_CONCURRENCY = _env_int('YTD_FRAGMENT_CONCURRENCY', 4)
+HTTP_CHUNK_SIZE = _env_int('YTD_HTTP_CHUNK_SIZE', 10 * 1024 * 1024)
+DOWNLOAD_RETRIES = _env_int('YTD_DOWNLOAD_RETRIES', 10)
+# Whole-download attempts per job; each one resumes the partial files
+DOWNLOAD_ATTEMPTS = _env_int('YTD_DOWNLOAD_ATTEMPTS', 3)
+
+# Optional export of finished files to shared storage instead of the browser:
+# a directory or s3://bucket/prefix (S3-compatible; set the endpoint for MinIO)
+EXPORT_TARGET = os.environ.get('YTD_EXPORT_TARGET', '')
+EXPORT_ENDPOINT = os.environ.get('YTD_EXPORT_ENDPOINT', '')
+# Public base URL of the target; without it links are paths or presigned URLs
+EXPORT_URL = os.environ.get('YTD_EXPORT_URL', '').rstrip('/')
+EXPORT_LINK_TTL = _env_int('YTD_EXPORT_LINK_TTL', 7 * 24 * 60 * 60)
+EXPORT_PART_SIZE = _env_int('YTD_EXPORT_PART_SIZE', 16 * 1024 * 1024)
+
+# Bandwidth caps in bytes/s (0 = unlimited), shared fairly between downloads
+BANDWIDTH_LIMIT = _env_int('YTD_BANDWIDTH_LIMIT', 0)
+SESSION_BANDWIDTH_LIMIT = _env_int('YTD_SESSION_BANDWIDTH_LIMIT', 0)
+
+# Background download jobs: worker threads and how many may wait in line
+JOB_WORKERS = _env_int('YTD_JOB_WORKERS', 2)
+JOB_QUEUE_SIZE = _env_int('YTD_JOB_QUEUE_SIZE', 16)
+# Downloads one session may have queued or running at a time
+SESSION_MAX_JOBS = _env_int('YTD_SESSION_MAX_JOBS', 2)
+
+# Batch mode: max videos per batch and parallel metadata lookups
+BATCH_MAX_ITEMS = _env_int('YTD_BATCH_MAX_ITEMS', 200)
+BATCH_WORKERS = _env_int('YTD_BATCH_WORKERS', 4)
+# Batches one session may run at a time, and queue slots batches leave free
+# so single downloads still get in while a long batch is running
+SESSION_MAX_BATCHES = _env_int('YTD_SESSION_MAX_BATCHES', 1)
+BATCH_QUEUE_RESERVE = _env_int('YTD_BATCH_QUEUE_RESERVE', 4)
+
+# Audio-only choices offered next to the original M4A: codec[:kbps], comma-separated
+AUDIO_PRESETS = os.environ.get('YTD_AUDIO_PRESETS', 'mp3:320,mp3:192,mp3:128,opus:128')
+
+# Seconds between progress updates pushed to the UI (and other listeners)
+PROGRESS_INTERVAL = float(os.environ.get('YTD_PROGRESS_INTERVAL') or 0.5)
+
+# Files up to this size may still be handed over through st.download_button
+INLINE_LIMIT = _env_int('YTD_INLINE_LIMIT', 50 * 1024 * 1024)
+# ...as long as all sessions together hold no more than this in memory,
+# each for at most INLINE_HOLD seconds
+INLINE_BUDGET = _env_int('YTD_INLINE_BUDGET', 512 * 1024 * 1024)
+INLINE_HOLD = _env_int('YTD_INLINE_HOLD', 5 * 60)
+
+# extract_info results, shared by all sessions
+METADATA_TTL = _env_int('YTD_METADATA_TTL', 30 * 60)
+METADATA_CACHE_SIZE = _env_int('YTD_METADATA_CACHE_SIZE', 256)
+# Parallel extract_info calls for searches typed into the UI
+LOOKUP_WORKERS = _env_int('YTD_LOOKUP_WORKERS', 4)
+# Shared state (jobs, metadata, finished-file locations) for all app processes:
+# a SQLite file (the default, one machine) or redis://host:port/db (several).
+STATE_URL = os.environ.get('YTD_STATE_URL') or os.path.join(DATA_DIR, 'state.db')
+
+# Result-card thumbnails, fetched and downsized by the server
+THUMBNAIL_DIR = os.path.join(DATA_DIR, 'thumbnails')
+THUMBNAIL_WIDTH = _env_int('YTD_THUMBNAIL_WIDTH', 480)
+THUMBNAIL_CACHE_MAX_BYTES = _env_int('YTD_THUMBNAIL_CACHE_SIZE', 64 * 1024 * 1024)
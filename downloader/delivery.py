@@ -0,0 +1,346 @@
+"""Disk-backed delivery of finished files.
+
+Completed downloads are moved into a delivery directory and streamed to the
+browser by a small threaded HTTP server (``sendfile`` + HTTP Range support),
+so serving a 4 GB video never means holding 4 GB in the Streamlit worker.
+Entries expire after ``DELIVERY_TTL`` seconds and are removed by a janitor
+thread.
+
+Every app process runs its own file server.  The first one on a machine
+gets ``FILE_SERVER_PORT``; the others, finding it taken, listen on a free
+port of their own.  They all serve the same ``DELIVERY_DIR``, so a file
+published by one process can be fetched from any of them.
+"""
+import logging
+import mimetypes
+import os
+import re
+import secrets
+import shutil
+import socket
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+
+from . import config
+from .metrics import get_metrics
+
+log = logging.getLogger(__name__)
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_TOKEN_RE = re.compile(r'^[A-Za-z0-9_-]+$')
+_HOST_RE = re.compile(r'^(\[[^\]]*\]|[^:]*)')  # host part of a Host header, IPv6 aware
+
+
+class DeliveryStore:
+    """Keeps finished files at ``<root>/<token>/<filename>`` for ``ttl`` seconds."""
+
+    def __init__(self, root, ttl):
+        self.root = root
+        self.ttl = ttl
+        os.makedirs(root, exist_ok=True)
+
+    def publish(self, path, filename=None, move=True):
+        """Hand a finished file over to the store and return its token.
+
+        With ``move=False`` the file is hard-linked (copied across filesystems),
+        so the source, e.g. a cached result, stays where it is.
+        """
+        filename = os.path.basename(filename or path)
+        token = secrets.token_urlsafe(16)
+        entry_dir = os.path.join(self.root, token)
+        os.makedirs(entry_dir)
+        target = os.path.join(entry_dir, filename)
+        if move:
+            shutil.move(path, target)
+        else:
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copyfile(path, target)
+        return token
+
+    def publish_many(self, paths):
+        """Hard-link several files into one entry (served as a ZIP) and return its token."""
+        token = self.open_bundle()
+        for path in paths:
+            self.add_to_bundle(token, path)
+        return token
+
+    def open_bundle(self):
+        """Create an empty entry to fill with :meth:`add_to_bundle` and return its token."""
+        token = secrets.token_urlsafe(16)
+        os.makedirs(os.path.join(self.root, token))
+        return token
+
+    def add_to_bundle(self, token, path):
+        """Hard-link (or copy) ``path`` into a bundle entry and return the name it got.
+
+        Two playlist entries may well share a title, so a name already taken
+        gets a numeric suffix.  Safe to call from several threads at once.
+        """
+        entry_dir = os.path.join(self.root, token)
+        stem, ext = os.path.splitext(os.path.basename(path))
+        name, n = stem + ext, 1
+        while True:
+            target = os.path.join(entry_dir, name)
+            try:
+                try:
+                    os.link(path, target)
+                except FileExistsError:
+                    raise
+                except OSError:
+                    # Another filesystem: claim the name, then copy
+                    with open(target, 'xb') as dst, open(path, 'rb') as src:
+                        shutil.copyfileobj(src, dst)
+                return name
+            except FileExistsError:
+                n += 1
+                name = f'{stem}_{n}{ext}'
+
+    def touch(self, token):
+        """Restart the TTL of an entry that is still being filled."""
+        try:
+            os.utime(os.path.join(self.root, token))
+        except OSError:
+            pass
+
+    def resolve_dir(self, token):
+        """Return the directory of a live entry, or None."""
+        if not _TOKEN_RE.match(token):
+            return None
+        entry_dir = os.path.join(self.root, token)
+        try:
+            if time.time() - os.path.getmtime(entry_dir) > self.ttl:
+                return None
+        except OSError:
+            return None
+        return entry_dir
+
+    def resolve(self, token, filename):
+        """Return the on-disk path of a live entry, or None."""
+        entry_dir = self.resolve_dir(token)
+        if not entry_dir or os.path.basename(filename) != filename:
+            return None
+        path = os.path.join(entry_dir, filename)
+        return path if os.path.isfile(path) else None
+
+    def url_path(self, token, filename):
+        return f'/files/{token}/{quote(filename)}'
+
+    def zip_url_path(self, token, zipname):
+        return f'/zip/{token}/{quote(zipname)}'
+
+    def purge_expired(self):
+        now = time.time()
+        for name in os.listdir(self.root):
+            entry_dir = os.path.join(self.root, name)
+            try:
+                expired = now - os.path.getmtime(entry_dir) > self.ttl
+            except OSError:
+                continue
+            if expired:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+
+
+class _FileRequestHandler(BaseHTTPRequestHandler):
+    store = None  # set on the per-server subclass
+
+    def log_message(self, fmt, *args):
+        log.debug('%s - ' + fmt, self.address_string(), *args)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        parts = self.path.split('?', 1)[0].strip('/').split('/')
+        if parts == ['metrics']:
+            self._serve_metrics(send_body)
+            return
+        if len(parts) != 3 or parts[0] not in ('files', 'zip'):
+            self.send_error(404)
+            return
+        if parts[0] == 'zip':
+            self._serve_zip(parts[1], unquote(parts[2]), send_body)
+            return
+        filename = unquote(parts[2])
+        path = self.store.resolve(parts[1], filename)
+        if not path:
+            self.send_error(404, 'File not found or expired')
+            return
+
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            start, end = 0, size - 1
+            status = 200
+
+            range_header = self.headers.get('Range')
+            if range_header:
+                m = _RANGE_RE.match(range_header.strip())
+                if not m or not (m.group(1) or m.group(2)):
+                    self._send_unsatisfiable(size)
+                    return
+                if m.group(1):
+                    start = int(m.group(1))
+                    if m.group(2):
+                        end = min(int(m.group(2)), size - 1)
+                else:
+                    # Suffix range: the last N bytes
+                    start = max(size - int(m.group(2)), 0)
+                if start > end or start >= size:
+                    self._send_unsatisfiable(size)
+                    return
+                status = 206
+
+            length = end - start + 1
+            self.send_response(status)
+            self.send_header('Content-Type', mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+            self.send_header('Content-Length', str(length))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Disposition', f"attachment; filename*=UTF-8''{quote(filename)}")
+            if status == 206:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.end_headers()
+
+            if send_body and length > 0:
+                try:
+                    with get_metrics().timer('serve') as record:
+                        # Zero-copy where the platform allows it, chunked reads otherwise
+                        self.connection.sendfile(f, offset=start, count=length)
+                        record['bytes'] = length
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+    def _serve_zip(self, token, zipname, send_body):
+        # The archive is built on the fly while it is sent: entries are
+        # stored uncompressed (video is already compressed) and written
+        # straight to the socket, so nothing is staged in memory or on disk.
+        entry_dir = self.store.resolve_dir(token)
+        if not entry_dir:
+            self.send_error(404, 'Bundle not found or expired')
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Content-Disposition', f"attachment; filename*=UTF-8''{quote(zipname)}")
+        self.end_headers()
+        if not send_body:
+            return
+        try:
+            with get_metrics().timer('serve-zip') as record, \
+                    zipfile.ZipFile(self.wfile, 'w', zipfile.ZIP_STORED, allowZip64=True) as zf:
+                for name in sorted(os.listdir(entry_dir)):
+                    zf.write(os.path.join(entry_dir, name), arcname=name)
+                record['bytes'] = zf.start_dir
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _serve_metrics(self, send_body):
+        body = get_metrics().render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _send_unsatisfiable(self, size):
+        self.send_response(416)
+        self.send_header('Content-Range', f'bytes */{size}')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+def start_file_server(store, host, port):
+    """Serve ``store`` over HTTP from a daemon thread and return the server."""
+    handler = type('FileRequestHandler', (_FileRequestHandler,), {'store': store})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='ytd-file-server', daemon=True).start()
+    return server
+
+
+def _janitor(store):
+    interval = max(min(store.ttl / 4, 60), 1)
+    while True:
+        time.sleep(interval)
+        try:
+            store.purge_expired()
+        except Exception:
+            log.exception('Delivery cleanup failed')
+
+
+class Delivery:
+    """Process-wide delivery store plus (optionally) its file server."""
+
+    def __init__(self, store, server):
+        self.store = store
+        self.server = server
+
+    def link(self, token, filename, host=None):
+        """Public URL for a published file, or None when there is no file server.
+
+        ``host`` is the Host header the browser used to reach the app; it is
+        only needed when ``YTD_FILE_SERVER_URL`` is not configured.
+        """
+        if not self.server:
+            return None
+        return self._base_url(host) + self.store.url_path(token, filename)
+
+    def zip_link(self, token, zipname, host=None):
+        """Like :meth:`link`, for a bundle published with ``publish_many``."""
+        if not self.server:
+            return None
+        return self._base_url(host) + self.store.zip_url_path(token, zipname)
+
+    def server_url(self):
+        """Base URL under which other app processes reach this file server, or None.
+
+        Internal: browsers get :meth:`link`, or ``YTD_FILE_SERVER_URL``.
+        """
+        if not self.server:
+            return None
+        host = config.FILE_SERVER_HOST
+        if host in ('', '0.0.0.0', '::'):
+            host = socket.gethostname()
+        elif ':' in host:
+            host = f'[{host}]'
+        return f'http://{host}:{self.server.server_address[1]}'
+
+    def _base_url(self, host):
+        if config.FILE_SERVER_URL:
+            return config.FILE_SERVER_URL
+        hostname = _HOST_RE.match(host or 'localhost').group(1)
+        return f'http://{hostname}:{self.server.server_address[1]}'
+
+
+_delivery = None
+_delivery_lock = threading.Lock()
+
+
+def get_delivery():
+    """Return the process-wide :class:`Delivery`, starting it on first use."""
+    global _delivery
+    with _delivery_lock:
+        if _delivery is None:
+            store = DeliveryStore(config.DELIVERY_DIR, config.DELIVERY_TTL)
+            store.purge_expired()
+            server = None
+            for port in dict.fromkeys((config.FILE_SERVER_PORT, 0)):
+                try:
+                    server = start_file_server(store, config.FILE_SERVER_HOST, port)
+                    break
+                except OSError as e:
+                    # Most likely another app process on this machine has the port
+                    log.warning('Could not start the file server on port %d: %s', port, e)
+            if server is None:
+                log.error('No file server; only files that fit the inline budget can be handed out')
+            else:
+                log.info('File server listening on port %d', server.server_address[1])
+            threading.Thread(target=_janitor, args=(store,), name='ytd-delivery-janitor', daemon=True).start()
+            _delivery = Delivery(store, server)
+        return _delivery
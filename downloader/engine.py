@@ -0,0 +1,214 @@
+"""Download engine: metadata, download and merge, usable without Streamlit.
+
+:func:`download` is the plain Python entry point (the CLI and batch jobs use
+it); :func:`download_job` wraps it for the background job queue behind the
+Streamlit UI.  Either way, finished files go through the shared result cache.
+yt-dlp is imported when the first download starts (see :mod:`downloader.metadata`).
+"""
+import logging
+import os
+import shutil
+import time
+
+from . import config
+from .bandwidth import get_bandwidth
+from .delivery import get_delivery
+from .export import Export, get_exporter
+from .ffmpeg import get_ffmpeg_path
+from .formats import best_option, option_variant, plan_option
+from .metadata import download_with_cache, fetch_info, video_key
+from .metrics import StageClock, get_metrics
+from .progress import ProgressReporter
+from .results import get_result_cache, result_key
+
+log = logging.getLogger(__name__)
+
+
+def build_download_opts(out_dir, option=None, ffmpeg_path=None, progress_hooks=(), postprocessor_hooks=(),
+                        streamable=False):
+    """yt-dlp options for downloading ``option`` (see :mod:`downloader.formats`) into ``out_dir``.
+
+    ``streamable`` merges MP4 as fragmented MP4, which FFmpeg writes front to
+    back, so the file can be uploaded while it is being merged.
+    """
+    option = option or best_option()
+    dl_opts = {
+        'outtmpl': os.path.join(out_dir, '%(title)s.%(ext)s'),
+        'quiet': True,
+        'no_warnings': True,
+        'noprogress': True,  # progress goes through the hooks, not the console
+        'restrictfilenames': True,
+        'format': option['format'],
+        # Fetch DASH/HLS fragments in parallel and plain files in ranged
+        # chunks; partial files are kept and resumed on the next attempt
+        'concurrent_fragment_downloads': config.FRAGMENT_CONCURRENCY,
+        'http_chunk_size': config.HTTP_CHUNK_SIZE or None,
+        'retries': config.DOWNLOAD_RETRIES,
+        'fragment_retries': config.DOWNLOAD_RETRIES,
+        'continuedl': True,
+        'progress_hooks': list(progress_hooks),
+        'postprocessor_hooks': list(postprocessor_hooks),
+    }
+    if option['audio_only']:
+        dl_opts['postprocessors'] = [{'key': 'FFmpegExtractAudio', 'preferredcodec': option['container'],
+                                      'preferredquality': str(option['bitrate']) if option.get('bitrate') else None}]
+    else:
+        dl_opts['merge_output_format'] = option['container']
+    if option.get('postprocessor_args'):
+        dl_opts['postprocessor_args'] = option['postprocessor_args']
+    if streamable and not option['audio_only'] and option['container'] == 'mp4':
+        # Comes after yt-dlp's own '+faststart', which would rewrite the whole file at the end
+        pp_args = dict(dl_opts.get('postprocessor_args') or {})
+        pp_args['merger+ffmpeg_o'] = list(pp_args.get('merger+ffmpeg_o') or []) + [
+            '-movflags', '+frag_keyframe+empty_moov+default_base_moof']
+        dl_opts['postprocessor_args'] = pp_args
+    if option.get('section'):
+        # Only this part is fetched: yt-dlp hands the range to FFmpeg, which
+        # seeks in the remote streams instead of downloading them whole
+        from yt_dlp.utils import download_range_func
+
+        start, end = option['section']
+        dl_opts['download_ranges'] = download_range_func(None, [(start, end)])
+        dl_opts['outtmpl'] = os.path.join(out_dir, f'%(title)s_{start:g}s-{end:g}s.%(ext)s')
+    if ffmpeg_path:
+        dl_opts['ffmpeg_location'] = ffmpeg_path
+    return dl_opts
+
+
+def download(url, option=None, output_dir=None, ffmpeg_path=None, reporter=None, on_wait=None, export=None):
+    """Download and merge ``url``, returning the path of the finished file.
+
+    ``option`` picks the quality (see :func:`~downloader.formats.format_options`;
+    best video + audio as MP4 by default) and is planned for a stream-copy
+    merge first if it was not already.  The file lives in the shared
+    result cache; with ``output_dir`` it is additionally linked (or copied)
+    there and that path is returned.  ``ffmpeg_path`` defaults to the
+    auto-detected binary, ``reporter`` is an optional
+    :class:`~downloader.progress.ProgressReporter` and ``on_wait`` is called
+    if the same file is already being produced elsewhere.  An
+    :class:`~downloader.export.Export` passed as ``export`` starts uploading
+    during the merge; the caller completes it with ``export.finish(path)``.
+    """
+    option = option or best_option()
+    if 'strategy' not in option:
+        # Not planned against this video's formats yet (CLI, batch); the
+        # metadata lands in the cache, so the download below reuses it
+        option = plan_option(fetch_info(url), option)
+    log.info('Downloading %s as %s (%s, %s)', url, option['format'], option['container'], option['strategy'])
+    if ffmpeg_path is None:
+        ffmpeg_path = get_ffmpeg_path()
+    clock = StageClock(reporter.job if reporter else None)
+    hooks = {'progress_hooks': [clock.progress_hook], 'postprocessor_hooks': [clock.postprocessor_hook]}
+    if reporter:
+        reporter.merge_strategy = option['strategy']
+        hooks['progress_hooks'].append(reporter.progress_hook)
+        hooks['postprocessor_hooks'].append(reporter.postprocessor_hook)
+    if export:
+        hooks['postprocessor_hooks'].append(export.postprocessor_hook)
+    # Exported MP4 merges are fragmented, a different file from the plain one
+    streamable = export is not None and not option['audio_only'] and option['container'] == 'mp4'
+
+    def run_download(work_dir):
+        import yt_dlp
+        from yt_dlp.postprocessor.ffmpeg import FFmpegPostProcessor
+
+        # Throttled to this download's fair share of the bandwidth while it runs
+        share = get_bandwidth().register(reporter.job if reporter else None)
+        if option.get('section') and ffmpeg_path:
+            # yt-dlp checks for FFmpeg before partial downloads without looking
+            # at ffmpeg_location; this is what its own command line sets instead
+            FFmpegPostProcessor._ffmpeg_location.set(ffmpeg_path)
+        run_hooks = {'progress_hooks': [share.progress_hook] + hooks['progress_hooks'],
+                     'postprocessor_hooks': [share.postprocessor_hook] + hooks['postprocessor_hooks']}
+        try:
+            # The work dir outlives failed attempts, so each retry (here or by a
+            # later job for the same file) resumes the partial files in it
+            for attempt in range(1, max(config.DOWNLOAD_ATTEMPTS, 1) + 1):
+                try:
+                    # Reuse the cached format list instead of extracting again
+                    opts = build_download_opts(work_dir, option, ffmpeg_path, streamable=streamable,
+                                               **run_hooks)
+                    with yt_dlp.YoutubeDL(opts) as ydl:
+                        info = download_with_cache(ydl, url)
+                    break
+                except yt_dlp.utils.DownloadError as e:
+                    if attempt >= config.DOWNLOAD_ATTEMPTS:
+                        raise
+                    log.warning('Download of %s failed (attempt %d), resuming: %s', url, attempt, e)
+                    time.sleep(2 ** attempt)
+        finally:
+            share.release()
+        clock.finish_download()
+
+        for fmt in info.get('requested_downloads') or []:
+            if fmt.get('filepath') and os.path.isfile(fmt['filepath']):
+                return fmt['filepath']
+        files = [f for f in os.listdir(work_dir) if os.path.isfile(os.path.join(work_dir, f))
+                 and not f.endswith(('.part', '.ytdl'))]
+        return os.path.join(work_dir, files[0]) if files else None
+
+    # Served from the shared result cache when this exact file was made before
+    cache = get_result_cache()
+    variant = option_variant(option)
+    key = result_key(video_key(url), option['format'], option['container'], variant)
+    if streamable:
+        # A plain MP4 exports just as well; a fragmented one is only ever
+        # handed out for exports, under its own key
+        filepath = cache.lookup(key)
+        if not filepath:
+            key = result_key(video_key(url), option['format'], option['container'],
+                             ' '.join(filter(None, (variant, 'fragmented'))))
+            filepath = cache.get_or_create(key, run_download, on_wait=on_wait)
+    else:
+        filepath = cache.get_or_create(key, run_download, on_wait=on_wait)
+    if not filepath:
+        raise RuntimeError('File not found')
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        target = os.path.join(output_dir, os.path.basename(filepath))
+        if os.path.exists(target):
+            os.remove(target)
+        try:
+            os.link(filepath, target)
+        except OSError:
+            shutil.copyfile(filepath, target)
+        return target
+    return filepath
+
+
+def download_job(job, url, ffmpeg_path=None, option=None):
+    """Run :func:`download` for a :class:`~downloader.jobs.Job` and publish the file.
+
+    Progress is reported on the job through a throttled
+    :class:`~downloader.progress.ProgressReporter`.  Returns
+    ``{'token', 'filename', 'size', 'server', 'public_server'}`` for the delivery store, plus ``'link'``
+    to the exported copy when an export target is configured.
+    """
+    exporter = get_exporter()
+    export = Export(exporter, job) if exporter else None
+    try:
+        filepath = download(url, option, ffmpeg_path=ffmpeg_path, reporter=ProgressReporter(job),
+                            on_wait=lambda: job.update(stage='shared'), export=export)
+    except BaseException:
+        if export:
+            export.abort()
+        raise
+
+    # Hand a link of the cached file to the delivery store, which keeps it
+    # downloadable for its TTL even if the cache evicts it meanwhile
+    filename = os.path.basename(filepath)
+    size = os.path.getsize(filepath)
+    with get_metrics().timer('publish', job) as record:
+        record['bytes'] = size
+        token = get_delivery().store.publish(filepath, filename, move=False)
+    # Other app processes fetch the file from 'server' (or send the browser to
+    # 'public_server') when they do not share this one's delivery directory
+    delivery = get_delivery()
+    result = {'token': token, 'filename': filename, 'size': size, 'server': delivery.server_url(),
+              'public_server': (delivery.server and config.FILE_SERVER_URL) or None}
+    if export:
+        job.update(stage='export')
+        result['link'] = export.finish(filepath)
+    log.info('job=%s %s', job.id, ' '.join(f'{stage}={seconds:.3f}' for stage, seconds in job.timings.items()))
+    return result
@@ -0,0 +1,282 @@
+"""Direct-to-storage export of finished downloads.
+
+With ``YTD_EXPORT_TARGET`` set, finished files are written to shared
+storage, either a (mounted) directory or an S3-compatible bucket given as
+``s3://bucket/prefix``.  For the bucket, point ``YTD_EXPORT_ENDPOINT`` at
+MinIO or similar, and install boto3.  The user gets a link instead of a
+browser transfer.
+
+Uploads are multipart.  When a download is merged, the upload starts while
+FFmpeg is still writing: an :class:`Export` follows the merge output and
+ships every complete part as soon as it is on disk.  Merges write a
+fragmented MP4 then, which is written front to back.  Once the file is
+finished, any part that FFmpeg went back and rewrote is uploaded again, so
+the stored object always matches the file.
+
+Every export is stored as ``<id>/<filename>`` with a fresh random id, so
+exporting another file with the same title (another quality, a clip, the
+same video for someone else) never replaces an object a link points to.
+"""
+import logging
+import os
+import secrets
+import threading
+import zlib
+from urllib.parse import quote, urlsplit
+
+from . import config
+from .metrics import get_metrics
+
+log = logging.getLogger(__name__)
+
+# How often a followed file is checked for new complete parts (seconds)
+_FOLLOW_INTERVAL = 0.25
+# S3 refuses parts smaller than this (except the last one)
+_MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class LocalTarget:
+    """Exports into a directory, e.g. a network share; links are ``base_url/<name>`` or the path.
+
+    ``name`` may contain ``/``: the directories are created on completion.
+    """
+
+    def __init__(self, root, base_url=''):
+        self.root = root
+        self.base_url = base_url
+        os.makedirs(root, exist_ok=True)
+
+    def begin(self, name):
+        # Parts are written in place into a hidden file, renamed when complete
+        handle = os.path.join(self.root, f'.{os.path.basename(name)}.{secrets.token_hex(4)}.part')
+        open(handle, 'wb').close()
+        return handle
+
+    def put_part(self, handle, number, offset, data):
+        # seek + write rather than os.pwrite, which Windows lacks
+        with open(handle, 'r+b') as f:
+            f.seek(offset)
+            f.write(data)
+
+    def complete(self, handle, name, size, count):
+        with open(handle, 'r+b') as f:
+            f.truncate(size)
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(handle, path)
+        return f'{self.base_url}/{quote(name)}' if self.base_url else path
+
+    def abort(self, handle):
+        try:
+            os.remove(handle)
+        except OSError:
+            pass
+
+
+class S3Target:
+    """Exports into an S3-compatible bucket; links are presigned unless ``base_url`` is set."""
+
+    def __init__(self, bucket, prefix='', endpoint=None, base_url='', link_ttl=7 * 24 * 60 * 60):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError('Exporting to s3:// needs boto3 (pip install boto3)') from None
+        self.client = boto3.client('s3', endpoint_url=endpoint or None)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.base_url = base_url
+        self.link_ttl = link_ttl
+
+    def begin(self, name):
+        key = self.prefix + name
+        upload = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)
+        return {'key': key, 'upload_id': upload['UploadId'], 'etags': {}}
+
+    def put_part(self, handle, number, offset, data):
+        part = self.client.upload_part(Bucket=self.bucket, Key=handle['key'], UploadId=handle['upload_id'],
+                                       PartNumber=number, Body=data)
+        handle['etags'][number] = part['ETag']
+
+    def complete(self, handle, name, size, count):
+        # Parts past the end of the final file (it shrank) are left out and discarded
+        parts = [{'PartNumber': n, 'ETag': handle['etags'][n]} for n in range(1, count + 1)]
+        self.client.complete_multipart_upload(Bucket=self.bucket, Key=handle['key'], UploadId=handle['upload_id'],
+                                              MultipartUpload={'Parts': parts})
+        if self.base_url:
+            return f'{self.base_url}/{quote(handle["key"])}'
+        return self.client.generate_presigned_url('get_object', Params={'Bucket': self.bucket, 'Key': handle['key']},
+                                                  ExpiresIn=self.link_ttl)
+
+    def abort(self, handle):
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=handle['key'], UploadId=handle['upload_id'])
+        except Exception:
+            log.warning('Could not abort multipart upload of %s', handle['key'], exc_info=True)
+
+
+class Upload:
+    """One multipart upload of ``name``, fed from a file that may still be growing."""
+
+    def __init__(self, target, name, part_size):
+        self.target = target
+        self.name = name
+        self.key = f'{secrets.token_hex(8)}/{name}'  # what it is stored as, see the module docstring
+        self.part_size = part_size
+        self.handle = target.begin(self.key)
+        self._sent = {}  # part number -> crc32 of what was uploaded
+        self._stop = threading.Event()
+        self._thread = None
+
+    def follow(self, path):
+        """Upload complete parts of ``path`` in the background while it is being written."""
+        self._thread = threading.Thread(target=self._follow, args=(path,), name='ytd-export', daemon=True)
+        self._thread.start()
+
+    def _follow(self, path):
+        f = None
+        try:
+            while not self._stop.is_set():
+                if f is None and os.path.exists(path):
+                    # Kept open: the merge renames the file when done, same inode
+                    f = open(path, 'rb')
+                if f is not None:
+                    size = os.fstat(f.fileno()).st_size
+                    while size >= (len(self._sent) + 1) * self.part_size and not self._stop.is_set():
+                        self._put(f, len(self._sent) + 1)
+                self._stop.wait(_FOLLOW_INTERVAL)
+        except Exception:
+            # Whatever is missing gets uploaded by finish()
+            log.warning('Streaming upload of %s stopped early', self.name, exc_info=True)
+        finally:
+            if f is not None:
+                f.close()
+
+    def _put(self, f, number):
+        offset = (number - 1) * self.part_size
+        f.seek(offset)
+        data = f.read(self.part_size)
+        crc = zlib.crc32(data)
+        if self._sent.get(number) == crc:
+            return False
+        self.target.put_part(self.handle, number, offset, data)
+        self._sent[number] = crc
+        return True
+
+    def finish(self, path):
+        """Upload what is still missing or changed in the finished ``path`` and return the link."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        size = os.path.getsize(path)
+        streamed, resent = len(self._sent), 0
+        try:
+            with open(path, 'rb') as f:
+                count = max(-(-size // self.part_size), 1)
+                for number in range(1, count + 1):
+                    if self._put(f, number) and number <= streamed:
+                        resent += 1
+            link = self.target.complete(self.handle, self.key, size, count)
+        except BaseException:
+            self.target.abort(self.handle)
+            raise
+        log.info('Exported %s (%d bytes in %d parts, %d streamed during the merge, %d sent again)',
+                 self.key, size, count, streamed, resent)
+        return link
+
+    def abort(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.target.abort(self.handle)
+
+
+class Exporter:
+    """Writes finished files to a target (:class:`LocalTarget` or :class:`S3Target`)."""
+
+    def __init__(self, target, part_size):
+        self.target = target
+        self.part_size = max(part_size, _MIN_PART_SIZE)
+
+    def upload(self, name):
+        return Upload(self.target, name, self.part_size)
+
+    def export(self, path, name=None):
+        """Upload the finished file at ``path`` and return its link."""
+        return self.upload(name or os.path.basename(path)).finish(path)
+
+
+class Export:
+    """Export of one download, started by its hooks while the merge still runs.
+
+    Install :meth:`postprocessor_hook` in the download, then call
+    :meth:`finish` with the finished file.
+    """
+
+    def __init__(self, exporter, job=None):
+        self.exporter = exporter
+        self.job = job
+        self._upload = None
+
+    def postprocessor_hook(self, d):
+        if d.get('postprocessor') != 'Merger' or d['status'] != 'started' or self._upload:
+            return
+        filepath = d['info_dict'].get('filepath')
+        if not filepath:
+            return
+        # yt-dlp merges into '<name>.temp.<ext>' and renames it when done
+        stem, ext = os.path.splitext(filepath)
+        try:
+            self._upload = self.exporter.upload(os.path.basename(filepath))
+        except Exception:
+            # finish() tries again with the whole file
+            log.warning('Could not start streaming upload of %s', filepath, exc_info=True)
+            return
+        self._upload.follow(f'{stem}.temp{ext}')
+
+    def finish(self, path):
+        """Complete the export of the finished file at ``path`` and return its link."""
+        upload, self._upload = self._upload, None
+        name = os.path.basename(path)
+        if upload is not None and upload.name != name:
+            upload.abort()
+            upload = None
+        if upload is None:
+            # Nothing merged here (cached result, single-file format): upload it whole
+            upload = self.exporter.upload(name)
+        with get_metrics().timer('export', self.job) as record:
+            link = upload.finish(path)
+            record['bytes'] = os.path.getsize(path)
+        return link
+
+    def abort(self):
+        if self._upload is not None:
+            self._upload.abort()
+            self._upload = None
+
+
+def make_target(spec):
+    """Build the target for a ``YTD_EXPORT_TARGET`` value (a path or ``s3://bucket/prefix``)."""
+    if spec.startswith('s3://'):
+        parts = urlsplit(spec)
+        prefix = parts.path.lstrip('/')
+        if prefix and not prefix.endswith('/'):
+            prefix += '/'
+        return S3Target(parts.netloc, prefix, config.EXPORT_ENDPOINT, config.EXPORT_URL, config.EXPORT_LINK_TTL)
+    if spec.startswith('file://'):
+        spec = urlsplit(spec).path
+    return LocalTarget(os.path.abspath(os.path.expanduser(spec)), config.EXPORT_URL)
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter():
+    """Return the process-wide :class:`Exporter`, or None when no target is configured."""
+    global _exporter
+    if not config.EXPORT_TARGET:
+        return None
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter = Exporter(make_target(config.EXPORT_TARGET), config.EXPORT_PART_SIZE)
+        return _exporter
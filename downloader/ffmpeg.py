@@ -0,0 +1,130 @@
+"""Smart FFmpeg detection.
+
+Locating FFmpeg can be slow (``static_ffmpeg`` may download and unpack a
+binary), so it happens at most once per process, on first use, and the
+result is persisted to ``FFMPEG_CACHE`` for the next start.  The record also
+carries the probed version, encoders and hwaccels, so callers can check
+capabilities without spawning ffmpeg again.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+
+from . import config
+
+log = logging.getLogger(__name__)
+
+_ENCODER_RE = re.compile(r'^\s*[VAS][F.][S.][X.][B.][D.]\s+(\w\S*)', re.M)
+
+_info = None
+_info_lock = threading.Lock()
+
+
+def _locate():
+    # Try getting ffmpeg from imageio_ffmpeg
+    try:
+        from imageio_ffmpeg import get_ffmpeg_exe
+        path = get_ffmpeg_exe()
+        if path and os.path.exists(path):
+            return path
+    except ImportError:
+        pass
+
+    # Try getting ffmpeg from static_ffmpeg
+    try:
+        import static_ffmpeg
+        static_ffmpeg.add_paths()
+    except ImportError:
+        pass
+
+    # Check common paths
+    cwd = os.getcwd()
+    possible_paths = [
+        os.path.join(cwd, 'ffmpeg'), os.path.join(cwd, 'ffmpeg.exe'),
+        os.path.join(cwd, 'bin', 'ffmpeg'), os.path.join(cwd, 'bin', 'ffmpeg.exe'),
+    ]
+    for path in possible_paths:
+        if os.path.exists(path) and os.access(path, os.X_OK):
+            return path
+
+    # Check system path
+    return shutil.which('ffmpeg')
+
+
+def _run(path, *args):
+    try:
+        return subprocess.run([path, '-hide_banner', *args], capture_output=True, text=True,
+                              timeout=15, check=False).stdout
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+
+def probe(path):
+    """Version, encoders and hwaccels of the ffmpeg binary at ``path``."""
+    version = _run(path, '-version').split('\n', 1)[0]
+    hwaccels = _run(path, '-hwaccels').splitlines()[1:]
+    stat = os.stat(path)
+    return {
+        'path': path,
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'version': version.split(' version ', 1)[-1].split(' ', 1)[0] if version else None,
+        'encoders': sorted(set(_ENCODER_RE.findall(_run(path, '-encoders')))),
+        'hwaccels': [line.strip() for line in hwaccels if line.strip()],
+    }
+
+
+def _load_cached():
+    try:
+        with open(config.FFMPEG_CACHE, encoding='utf-8') as f:
+            info = json.load(f)
+        stat = os.stat(info['path'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    # A replaced or upgraded binary invalidates the record
+    if stat.st_mtime != info.get('mtime') or stat.st_size != info.get('size'):
+        return None
+    return info
+
+
+def _save_cached(info):
+    try:
+        os.makedirs(os.path.dirname(config.FFMPEG_CACHE), exist_ok=True)
+        tmp = f'{config.FFMPEG_CACHE}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(info, f)
+        os.replace(tmp, config.FFMPEG_CACHE)
+    except OSError:
+        log.warning('Could not persist the FFmpeg probe to %s', config.FFMPEG_CACHE)
+
+
+def find_ffmpeg():
+    """Return the probed FFmpeg record (see :func:`probe`), or None if not found."""
+    global _info
+    with _info_lock:
+        if _info is None:
+            info = _load_cached()
+            if info is None:
+                path = _locate()
+                if path:
+                    info = probe(path)
+                    _save_cached(info)
+            # Not found is remembered for this process only; a later start retries
+            _info = info or {}
+        return _info or None
+
+
+def get_ffmpeg_path():
+    """Return the path of a usable ffmpeg binary, or None."""
+    info = find_ffmpeg()
+    return info['path'] if info else None
+
+
+def has_encoder(name):
+    """Whether the detected ffmpeg can encode with ``name`` (e.g. ``'aac'``)."""
+    info = find_ffmpeg()
+    return bool(info) and name in info['encoders']
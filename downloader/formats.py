@@ -0,0 +1,284 @@
+"""Quality choices and merge planning from an already-fetched info dict.
+
+:func:`format_options` turns ``info['formats']`` into a short list of
+options (best, one per resolution, audio only) with an estimated size each,
+without another extractor call.  Each video option is run through
+:func:`plan_option`, which picks streams that ffmpeg can simply copy into the
+target container (a remux takes seconds even for long videos) and only falls
+back to re-encoding the audio track, the cheapest conversion, when no
+fitting audio stream exists.  Video is never re-encoded: when nothing at the
+requested height fits, the container is switched instead.
+
+An option is a plain dict:
+
+``key``         stable identifier (``'best'``, ``'720p'``, ``'audio'``)
+``name``        what the UI shows, e.g. ``'720p MP4'``
+``format``      yt-dlp format selector
+``container``   merge / audio-extraction target (``'mp4'``, ``'m4a'``...)
+``audio_only``  whether the result is an audio file
+``max_height``  height limit the option was planned for (None for best)
+``size``        estimated bytes, or None when unknown
+``codec``       video codec of the planned stream (planned options only)
+``strategy``    ``'remux'``, ``'transcode-audio'`` or ``'single'`` (no merge)
+``postprocessor_args``  extra yt-dlp ``postprocessor_args``, if any
+``bitrate``     audio presets: target kbps of the conversion (absent otherwise)
+``section``     clips: ``(start, end)`` in seconds (see :func:`clip_option`)
+
+Audio presets come from ``YTD_AUDIO_PRESETS``; a source already in the
+preset's codec is copied rather than encoded a second time.
+"""
+import re
+
+from . import config
+from .ffmpeg import has_encoder
+from .progress import format_time
+
+# Codecs each container takes without conversion and that players handle well
+_FITS = {
+    'mp4': ({'avc1', 'avc3', 'h264', 'hev1', 'hvc1', 'h265', 'av01'}, {'mp4a', 'aac', 'mp3', 'ac-3', 'ec-3'}),
+    'webm': ({'vp8', 'vp9', 'vp09', 'av01'}, {'opus', 'vorbis'}),
+}
+
+# Audio-only targets: ffmpeg encoder and the source stream to prefer
+_AUDIO_CODECS = {
+    'm4a': ('aac', 'bestaudio[ext=m4a]/bestaudio'),
+    'mp3': ('libmp3lame', 'bestaudio'),
+    'opus': ('libopus', 'bestaudio[acodec=opus]/bestaudio'),
+}
+
+_TIME_RE = re.compile(r'^(?:(?:(\d+):)?(\d+):)?(\d+(?:\.\d+)?)$')
+
+# Cheapest audio conversion per container: (ffmpeg encoder, merger output args)
+_AUDIO_TRANSCODE = {
+    'mp4': ('aac', ['-c:a', 'aac', '-b:a', '192k']),
+    'webm': ('libopus', ['-c:a', 'libopus', '-b:a', '160k']),
+}
+
+
+def best_option():
+    """The app's default: best video + best audio merged to MP4."""
+    return {'key': 'best', 'name': 'High Quality MP4', 'format': 'bestvideo+bestaudio/best',
+            'container': 'mp4', 'audio_only': False, 'max_height': None, 'size': None}
+
+
+def height_option(height):
+    """Best streams up to ``height`` pixels, before planning."""
+    return {'key': f'{height}p', 'name': f'{height}p MP4',
+            'format': f'bestvideo[height<={height}]+bestaudio/best[height<={height}]',
+            'container': 'mp4', 'audio_only': False, 'max_height': height, 'size': None}
+
+
+def audio_option(codec='m4a', bitrate=None):
+    """Audio only; by default kept as M4A (no re-encode when an AAC stream exists).
+
+    Other ``codec`` values (see ``_AUDIO_CODECS``) and a ``bitrate`` in kbps
+    convert to that codec and rate.  Raises ValueError for unknown codecs.
+    """
+    if codec not in _AUDIO_CODECS:
+        raise ValueError(f'unknown audio codec {codec!r} (use one of {", ".join(_AUDIO_CODECS)})')
+    if codec == 'm4a' and not bitrate:
+        return {'key': 'audio', 'name': 'Audio M4A', 'format': 'bestaudio[ext=m4a]/bestaudio',
+                'container': 'm4a', 'audio_only': True, 'max_height': None, 'size': None}
+    name = f'Audio {codec.upper()}' + (f' {bitrate}k' if bitrate else '')
+    return {'key': f'audio-{codec}' + (f'-{bitrate}k' if bitrate else ''), 'name': name,
+            'format': _AUDIO_CODECS[codec][1], 'container': codec, 'audio_only': True, 'max_height': None,
+            'size': None, 'bitrate': bitrate}
+
+
+def audio_presets():
+    """Audio options from ``YTD_AUDIO_PRESETS`` (``codec[:kbps]``, comma-separated) this FFmpeg can encode."""
+    presets = []
+    for spec in config.AUDIO_PRESETS.split(','):
+        codec, _, bitrate = spec.strip().lower().partition(':')
+        if codec not in _AUDIO_CODECS or (bitrate and not bitrate.rstrip('k').isdigit()):
+            continue
+        if has_encoder(_AUDIO_CODECS[codec][0]):
+            presets.append(audio_option(codec, int(bitrate.rstrip('k')) if bitrate else None))
+    return presets
+
+
+def parse_time(text):
+    """Seconds from ``'90'``, ``'1:30'`` or ``'1:02:30'``; raises ValueError otherwise."""
+    m = _TIME_RE.match(text.strip())
+    if not m:
+        raise ValueError(f'{text.strip()!r} is not a time (use m:ss or h:mm:ss)')
+    hours, minutes, seconds = m.groups()
+    return int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds)
+
+
+def clip_option(option, start, end, duration=None):
+    """``option`` limited to the ``start``-``end`` (seconds) part of the video.
+
+    Only that section is downloaded: yt-dlp hands it to FFmpeg, which seeks
+    in the remote streams instead of fetching them whole.  Video is cut at
+    keyframes (no re-encode), so a clip may start a moment early.  Raises
+    ValueError for an empty range or one outside ``duration``.
+    """
+    if duration and start >= duration:
+        raise ValueError(f'The video is only {format_time(duration)} long')
+    if start < 0 or end <= start:
+        raise ValueError('The end of the clip must come after its start')
+    if duration:
+        end = min(end, duration)
+    clipped = dict(option, section=(start, end))
+    clipped['key'] = f"{option['key']}@{start:g}-{end:g}"
+    clipped['name'] = f"{option['name']} ({format_time(start)}–{format_time(end)})"
+    if option.get('size') and duration:
+        clipped['size'] = int(option['size'] * (end - start) / duration)
+    return clipped
+
+
+def option_variant(option):
+    """What, besides format and container, tells this option's file apart (``''`` for nothing)."""
+    parts = []
+    if option.get('bitrate'):
+        parts.append(f"{option['bitrate']}k")
+    if option.get('section'):
+        parts.append('{:g}-{:g}'.format(*option['section']))
+    return ' '.join(parts)
+
+
+def estimate_size(fmt, duration):
+    """Bytes a single format will take, from its size fields or its bitrate."""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    if fmt.get('tbr') and duration:
+        return int(fmt['tbr'] * 1000 / 8 * duration)
+    return None
+
+
+def _bitrate(fmt):
+    return fmt.get('tbr') or fmt.get('vbr') or fmt.get('abr') or 0
+
+
+def _codec(value):
+    # 'avc1.640028' -> 'avc1', 'mp4a.40.2' -> 'mp4a'
+    return (value or 'none').split('.')[0].lower()
+
+
+def _fits(container, kind, codec):
+    fits = _FITS.get(container)
+    return fits is None or codec in fits[0 if kind == 'video' else 1]
+
+
+def _is_video(fmt):
+    return fmt.get('vcodec') not in (None, 'none') and fmt.get('height')
+
+
+def _is_audio_only(fmt):
+    return fmt.get('acodec') not in (None, 'none') and fmt.get('vcodec') == 'none'
+
+
+def _sum_sizes(*sizes):
+    return None if None in sizes else sum(sizes)
+
+
+def _split_formats(info):
+    formats = [f for f in info.get('formats') or [] if f.get('url') and f.get('protocol') != 'mhtml']
+    video = [f for f in formats if _is_video(f) and f.get('acodec') == 'none']
+    audio = [f for f in formats if _is_audio_only(f)]
+    combined = [f for f in formats if _is_video(f) and f.get('acodec') not in (None, 'none')]
+    return video, audio, combined
+
+
+def plan_option(info, option):
+    """Pin ``option`` to streams that can be stream-copied into its container.
+
+    Returns a new option; audio-only options and sites without separate
+    video/audio streams come back unchanged apart from ``strategy``.
+    """
+    planned = dict(option)
+    if option['audio_only']:
+        planned['strategy'] = 'single'
+        return planned
+    video, audio, _ = _split_formats(info)
+    max_height = option.get('max_height')
+    if max_height:
+        video = [f for f in video if f['height'] <= max_height]
+    if not video or not audio:
+        planned['strategy'] = 'single'
+        return planned
+
+    container = option['container']
+    top = max(f['height'] for f in video)
+    fitting = [f for f in video if _fits(container, 'video', _codec(f['vcodec']))]
+    if max_height:
+        # A resolution option keeps its resolution; "best" may step down to stay in MP4
+        fitting = [f for f in fitting if f['height'] == top]
+    if fitting:
+        v = max(fitting, key=lambda f: (f['height'], _bitrate(f)))
+    else:
+        # Nothing fits at this height: copy into a container that does
+        v = max((f for f in video if f['height'] == top), key=_bitrate)
+        container = 'webm' if _fits('webm', 'video', _codec(v['vcodec'])) else 'mkv'
+
+    fitting_audio = [f for f in audio if _fits(container, 'audio', _codec(f['acodec']))]
+    planned['postprocessor_args'] = None
+    if fitting_audio:
+        a = max(fitting_audio, key=_bitrate)
+        planned['strategy'] = 'remux'
+    else:
+        a = max(audio, key=_bitrate)
+        encoder, args = _AUDIO_TRANSCODE[container]
+        if has_encoder(encoder):
+            planned['strategy'] = 'transcode-audio'
+            planned['postprocessor_args'] = {'merger+ffmpeg_o': args}
+        else:
+            container = 'mkv'
+            planned['strategy'] = 'remux'
+
+    planned['container'] = container
+    planned['name'] = f"{'High Quality' if max_height is None else f'{max_height}p'} {container.upper()}"
+    # Pin the exact streams the plan (and size estimate) is based on, with the
+    # generic selector as a fallback should the format list change
+    planned['format'] = f"{v['format_id']}+{a['format_id']}/{option['format']}"
+    planned['size'] = _sum_sizes(estimate_size(v, info.get('duration')), estimate_size(a, info.get('duration')))
+    planned['codec'] = _codec(v['vcodec'])
+    return planned
+
+
+def format_options(info):
+    """Quality options for ``info``, best first, each with a size estimate."""
+    duration = info.get('duration')
+    video, audio, combined = _split_formats(info)
+
+    options = [plan_option(info, best_option())]
+    if video and audio:
+        for height in sorted({f['height'] for f in video}, reverse=True):
+            options.append(plan_option(info, height_option(height)))
+    else:
+        # Only progressive (video + audio in one file) formats: nothing to merge
+        by_height = {}
+        for f in combined:
+            if f['height'] not in by_height or _bitrate(f) > _bitrate(by_height[f['height']]):
+                by_height[f['height']] = f
+        for height in sorted(by_height, reverse=True):
+            f = by_height[height]
+            option = height_option(height)
+            option.update(format=f"{f['format_id']}/{option['format']}", size=estimate_size(f, duration),
+                          codec=_codec(f['vcodec']), strategy='single')
+            options.append(option)
+        if len(options) > 1:
+            options[0]['size'] = options[1]['size']
+
+    if audio:
+        option = audio_option()
+        m4a = [f for f in audio if f.get('ext') == 'm4a']
+        option['size'] = estimate_size(max(m4a or audio, key=_bitrate), duration)
+        options.append(option)
+        for option in audio_presets():
+            if duration:
+                option['size'] = int(option['bitrate'] * 1000 / 8 * duration) if option['bitrate'] else None
+            options.append(option)
+    return options
+
+
+def option_label(option):
+    """``'720p MP4 (avc1) · ~48.2 MB'`` style label for a picker."""
+    label = option['name']
+    if option.get('codec'):
+        label += f" ({option['codec']})"
+    if option.get('size'):
+        label += f" · ~{option['size'] / 1024 ** 2:.1f} MB"
+    return label
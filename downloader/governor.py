@@ -0,0 +1,75 @@
+"""Admission control for memory held on behalf of sessions.
+
+``st.download_button`` copies the whole file into Streamlit's in-memory
+media store, where it stays for as long as the button is on screen.  Every
+session that does this is charged against one process-wide
+:class:`MemoryBudget`. When the budget is spent, the UI streams the file
+from the file server instead, or asks the user to wait. Holdings are
+released when the session moves on, and after ``INLINE_HOLD`` seconds at the
+latest, so an idle tab cannot pin memory for hours.
+"""
+import logging
+import threading
+import time
+
+from . import config
+
+log = logging.getLogger(__name__)
+
+
+class MemoryBudget:
+    """Process-wide cap on bytes held in memory, one holding per owner (session)."""
+
+    def __init__(self, limit, hold):
+        self.limit = limit
+        self.hold = hold
+        self._held = {}  # owner -> (key, nbytes, since)
+        self._lock = threading.Lock()
+
+    def acquire(self, owner, key, nbytes):
+        """Reserve ``nbytes`` for ``owner``'s payload ``key``; False if over budget.
+
+        A new key replaces the owner's previous holding.  Asking again for the
+        key already held succeeds without charging twice.
+        """
+        with self._lock:
+            self._expire()
+            current = self._held.get(owner)
+            if current and current[0] == key:
+                return True
+            in_use = sum(n for o, (_, n, _) in self._held.items() if o != owner)
+            if in_use + nbytes > self.limit:
+                log.info('Memory budget full (%d of %d bytes held), refusing %d bytes', in_use, self.limit, nbytes)
+                return False
+            self._held[owner] = (key, nbytes, time.monotonic())
+            return True
+
+    def release(self, owner):
+        with self._lock:
+            self._held.pop(owner, None)
+
+    def held(self):
+        """Bytes currently reserved across all owners."""
+        with self._lock:
+            self._expire()
+            return sum(n for _, n, _ in self._held.values())
+
+    def _expire(self):
+        # Sessions that went away without releasing: their memory is freed by
+        # Streamlit once the session ends, so the reservation can go too
+        cutoff = time.monotonic() - 2 * self.hold
+        for owner in [o for o, (_, _, since) in self._held.items() if since < cutoff]:
+            del self._held[owner]
+
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+def get_memory_budget():
+    """Return the process-wide :class:`MemoryBudget`."""
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = MemoryBudget(config.INLINE_BUDGET, config.INLINE_HOLD)
+        return _budget
@@ -0,0 +1,232 @@
+"""Background download jobs.
+
+Downloads run on a small pool of worker threads instead of inside the
+Streamlit script run, so a browser refresh no longer kills them and many
+users clicking Download at once queue up instead of oversubscribing the
+uplink.  The queue is bounded, and so is each owner's (session's) share of
+it: past either limit :meth:`JobQueue.submit` raises :class:`QueueFull` and
+the UI asks the user to try again later.  Batch jobs may also be kept out of
+the last few slots, so a long batch cannot lock single downloads out.
+
+Job records are mirrored to the shared state store (:mod:`downloader.state`),
+so another app process can show a job's progress and result, e.g. after a
+refresh lands on a different worker.  The process running a job re-saves it
+as a heartbeat; a record whose heartbeat stopped belongs to a process that
+died, and is reported as failed.
+"""
+import logging
+import queue
+import threading
+import time
+import uuid
+
+from . import config
+from .metrics import get_metrics
+from .state import get_state
+
+log = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED = 'finished'
+FAILED = 'failed'
+
+# Records of unfinished jobs (whose process may have died) expire after this
+_RUNNING_TTL = 24 * 60 * 60
+# Unfinished jobs are re-saved this often (seconds) ...
+_HEARTBEAT_INTERVAL = 30
+# ... and count as failed when their record is older than this
+_STALE_AFTER = 4 * _HEARTBEAT_INTERVAL
+
+
+class QueueFull(Exception):
+    """Raised when the job queue is at capacity."""
+
+
+class Job:
+    """State of one background job, updated by the worker and read by the UI."""
+
+    # What is shared with other processes (see :meth:`to_dict`)
+    FIELDS = ('id', 'label', 'owner', 'state', 'stage', 'detail', 'progress', 'speed', 'eta', 'rate_limit',
+              'message', 'result', 'error', 'created', 'started', 'finished', 'timings', 'heartbeat')
+
+    def __init__(self, label, owner=None):
+        self.id = uuid.uuid4().hex
+        self.label = label
+        self.owner = owner  # session that started the job, if any
+        self.state = QUEUED
+        self.stage = None  # 'download' / 'merge' while running
+        self.detail = None  # e.g. the merge strategy during 'merge'
+        self.progress = 0.0
+        self.speed = None
+        self.eta = None
+        self.rate_limit = None  # bytes/s this job may use, None when unlimited
+        self.message = None
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.timings = {}  # stage -> seconds, see downloader.metrics
+        self.heartbeat = None  # when the record was last written to the state store
+        self.remote = False  # a read-only copy of a job running in another process
+        self._sink = None  # called after updates; set by the JobQueue that runs the job
+        self._saved = 0  # the same, in time.monotonic()
+
+    @property
+    def done(self):
+        return self.state in (FINISHED, FAILED)
+
+    def update(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+        if self._sink is not None:
+            self._sink(self, force='state' in fields)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, record):
+        job = cls(record['label'])
+        for name in cls.FIELDS:
+            setattr(job, name, record.get(name))
+        job.remote = True
+        if not job.done and time.time() - (job.heartbeat or job.created) > _STALE_AFTER:
+            # Whatever process ran it is gone
+            job.state, job.error = FAILED, 'The download was interrupted. Please start it again.'
+            job.finished = job.heartbeat or job.created
+        return job
+
+
+class JobQueue:
+    """Bounded queue feeding a fixed pool of worker threads."""
+
+    def __init__(self, workers, max_pending, keep_finished=3600, max_per_owner=None, store=None):
+        self.keep_finished = keep_finished
+        self.max_per_owner = max_per_owner
+        self.store = store
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # keeps an older snapshot from overwriting a newer one
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f'ytd-job-worker-{i}', daemon=True).start()
+        if store is not None:
+            threading.Thread(target=self._heartbeat, name='ytd-job-heartbeat', daemon=True).start()
+
+    def submit(self, fn, *args, label=None, block=False, owner=None, reserve=0):
+        """Queue ``fn(job, *args)`` and return its :class:`Job`.
+
+        The function's return value ends up in ``job.result``; an exception
+        marks the job as failed with ``job.error`` set.  With ``block=True``
+        the call waits for room in the queue instead of raising
+        :class:`QueueFull` (for background feeders, never the UI thread).
+        ``owner`` tags the job with the session that asked for it; an owner
+        may have at most ``max_per_owner`` unfinished jobs.  With ``reserve``
+        the job is refused unless that many slots stay free for others.
+        """
+        job = Job(label, owner)
+        if self.store is not None:
+            job._sink = self._save
+        with self._lock:
+            self._prune()
+            if owner is not None and self.max_per_owner:
+                active = sum(1 for j in self._jobs.values() if j.owner == owner and not j.done)
+                if active >= self.max_per_owner:
+                    raise QueueFull(f'You already have {active} downloads in progress')
+            free = self._queue.maxsize - self._queue.qsize()
+            # Never all of it, or a reserve as big as the queue would refuse everything
+            if reserve and self._queue.maxsize and free <= min(reserve, self._queue.maxsize - 1):
+                raise QueueFull('The remaining queue slots are kept for single downloads')
+            self._jobs[job.id] = job
+        try:
+            self._queue.put((job, fn, args), block=block)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise QueueFull('Too many downloads are queued right now') from None
+        self._save(job, force=True)
+        return job
+
+    def get(self, job_id):
+        """The :class:`Job` with ``job_id``; a ``remote`` copy if another process runs it, or None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            try:
+                record = self.store.get('job', job_id)
+            except Exception:
+                log.warning('Could not read job %s from the state store', job_id, exc_info=True)
+                record = None
+            job = Job.from_dict(record) if record else None
+        return job
+
+    def position(self, job):
+        """1-based place of a queued job in line, or 0 once it has started (or is not ours)."""
+        if job.state != QUEUED or job.remote:
+            return 0
+        with self._lock:
+            waiting = [j for j in self._jobs.values() if j.state == QUEUED]
+        return sum(1 for j in waiting if j.created <= job.created)
+
+    def _work(self):
+        while True:
+            job, fn, args = self._queue.get()
+            job.update(state=RUNNING, started=time.time())
+            metrics = get_metrics()
+            metrics.observe('queue', job.started - job.created, job=job)
+            try:
+                job.result = fn(job, *args)
+                job.update(state=FINISHED, finished=time.time())
+            except Exception as e:
+                log.exception('Job %s failed', job.id)
+                job.update(state=FAILED, error=str(e), finished=time.time())
+            finally:
+                if job.finished is not None:
+                    metrics.observe('job', job.finished - job.started, job=job)
+                self._queue.task_done()
+
+    def _save(self, job, force=False):
+        # Progress updates arrive many times a second: write at most every
+        # PROGRESS_INTERVAL, but always when the job changes state
+        if self.store is None:
+            return
+        now = time.monotonic()
+        if not force and now - job._saved < config.PROGRESS_INTERVAL:
+            return
+        with self._save_lock:
+            job._saved = now
+            job.heartbeat = time.time()
+            try:
+                self.store.put('job', job.id, job.to_dict(), ttl=self.keep_finished if job.done else _RUNNING_TTL)
+            except Exception:
+                log.warning('Could not save job %s to the state store', job.id, exc_info=True)
+
+    def _heartbeat(self):
+        # Queued jobs too: they die with this process just the same
+        while True:
+            time.sleep(_HEARTBEAT_INTERVAL)
+            with self._lock:
+                unfinished = [j for j in self._jobs.values() if not j.done]
+            for job in unfinished:
+                self._save(job, force=True)
+
+    def _prune(self):
+        cutoff = time.time() - self.keep_finished
+        for job_id in [j.id for j in self._jobs.values() if j.done and j.finished < cutoff]:
+            del self._jobs[job_id]
+
+
+_jobs = None
+_jobs_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide :class:`JobQueue`."""
+    global _jobs
+    with _jobs_lock:
+        if _jobs is None:
+            _jobs = JobQueue(config.JOB_WORKERS, config.JOB_QUEUE_SIZE, max_per_owner=config.SESSION_MAX_JOBS,
+                             store=get_state())
+        return _jobs
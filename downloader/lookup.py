@@ -0,0 +1,116 @@
+"""Asynchronous metadata lookups for the UI.
+
+The search box used to run ``extract_info`` inside the script run, freezing
+the page for seconds.  A :class:`Lookup` runs :func:`~downloader.metadata.fetch_info`
+on a small thread pool instead and the page polls it.  Sessions looking up
+the same video share one extraction.  A lookup that is superseded (the user
+pasted another link) is cancelled: if it has not started yet, the extractor
+is never called.  One that is already running finishes into the metadata
+cache, so its result is not lost.  The card's thumbnail is fetched in the
+same background step, also when the metadata itself was cached, so the card
+can show it as soon as the lookup is done without fetching anything itself.
+"""
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from . import config
+from .metadata import fetch_info, get_metadata_cache, video_key
+from .thumbnails import get_thumbnails, pick_thumbnail
+
+log = logging.getLogger(__name__)
+
+
+class Lookup:
+    """One session's pending (or finished) metadata lookup for ``url``."""
+
+    def __init__(self, pool, url, key, future):
+        self.pool = pool
+        self.url = url
+        self.key = key
+        self.future = future
+
+    @property
+    def done(self):
+        return self.future.done()
+
+    def result(self):
+        """The info dict; raises what ``fetch_info`` raised (or ``CancelledError``)."""
+        return self.future.result()
+
+    def cancel(self):
+        self.pool.release(self)
+
+
+class LookupPool:
+    """Thread pool running metadata lookups, shared and cancellable per video."""
+
+    def __init__(self, workers):
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='ytd-lookup')
+        self._inflight = {}  # key -> [future, number of sessions waiting for it]
+        self._lock = threading.Lock()
+
+    def submit(self, url):
+        """Start looking ``url`` up and return its :class:`Lookup`."""
+        key = video_key(url)
+        info = get_metadata_cache().get(key)
+        if info is not None and self._thumbnail_cached(info):
+            future = Future()
+            future.set_result(info)
+            return Lookup(self, url, key, future)
+        with self._lock:
+            entry = self._inflight.get(key)
+            if entry:
+                entry[1] += 1
+            else:
+                entry = self._inflight[key] = [self._executor.submit(self._fetch, key, url), 1]
+        return Lookup(self, url, key, entry[0])
+
+    def release(self, lookup):
+        """Drop ``lookup``; its extraction is cancelled if nobody else waits for it."""
+        with self._lock:
+            entry = self._inflight.get(lookup.key)
+            if not entry or entry[0] is not lookup.future:
+                return
+            entry[1] -= 1
+            if entry[1] == 0 and lookup.future.cancel():
+                del self._inflight[lookup.key]
+                log.debug('Cancelled superseded lookup of %s', lookup.url)
+
+    @staticmethod
+    def _thumbnail_cached(info):
+        thumbnails = get_thumbnails()
+        url = pick_thumbnail(info, thumbnails.width)
+        return not url or thumbnails.cached(url) is not None
+
+    def _fetch(self, key, url):
+        try:
+            info = fetch_info(url)
+            thumbnails = get_thumbnails()
+            thumbnails.get(pick_thumbnail(info, thumbnails.width))
+            return info
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+def start_lookup(url, previous=None):
+    """Look ``url`` up in the background, cancelling the ``previous`` lookup it replaces."""
+    # Submitted first, so re-looking up the same video keeps its extraction alive
+    lookup = get_lookup_pool().submit(url)
+    if previous is not None:
+        previous.cancel()
+    return lookup
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_lookup_pool():
+    """Return the process-wide :class:`LookupPool`."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = LookupPool(config.LOOKUP_WORKERS)
+        return _pool
@@ -0,0 +1,216 @@
+"""Process-wide cache for ``extract_info`` results.
+
+Lookups are keyed by a normalized video ID (so ``youtu.be/x``, ``watch?v=x``
+and ``shorts/x`` share one entry) and hold the full, JSON-safe info dict
+including ``formats``, which lets the download step skip re-extraction.
+Entries are evicted LRU-first and after ``METADATA_TTL`` seconds; the TTL
+stays well below the lifetime of YouTube's signed format URLs.  Behind the
+in-memory LRU sits the shared state store (:mod:`downloader.state`), so
+other app processes and restarts reuse the extraction.
+
+yt-dlp itself is imported on first use, not with this module: it takes a
+few hundred milliseconds, which the app's first page and the CLI's
+``--help`` need not wait for (:func:`preload` gets it done in the
+background).
+"""
+import copy
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from . import config
+from .metrics import get_metrics
+from .state import get_state
+
+log = logging.getLogger(__name__)
+
+# youtube.com needs one of the video path shapes (a bare 11-character path
+# there is a channel or user name); youtu.be/<id> is the short form
+_YOUTUBE_ID_RE = re.compile(
+    r'(?:^|[/.])(?:youtube(?:-nocookie)?\.com/(?:watch\?(?:.*&)?v=|embed/|shorts/|live/|v/|e/)|youtu\.be/)'
+    r'([0-9A-Za-z_-]{11})(?![0-9A-Za-z_-])'
+)
+
+_YOUTUBE_HOST_RE = re.compile(r'^(?:[\w-]+\.)*(?:youtube(?:-nocookie)?\.com|youtu\.be)$')
+
+# Signed format URLs that expired answer with one of these
+_EXPIRED_RE = re.compile(r'HTTP Error (?:403|404|410)\b')
+
+
+def video_key(url):
+    """Normalize a URL into a cache key (``youtube:<id>`` for YouTube links)."""
+    url = url.strip()
+    m = _YOUTUBE_ID_RE.search(url)
+    if m:
+        return f'youtube:{m.group(1)}'
+    return url
+
+
+def normalize_url(text):
+    """Check pasted text is a complete video link and return it in canonical form.
+
+    YouTube links of any shape become ``https://www.youtube.com/watch?v=<id>``;
+    links to other sites pass through.  Raises ValueError, with a message fit
+    for the user, without contacting any site.
+    """
+    url = text.strip()
+    if not url:
+        raise ValueError('Paste a link first')
+    if '://' not in url:
+        # 'youtu.be/...' pasted without the scheme
+        url = f'https://{url}'
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if parts.scheme not in ('http', 'https') or '.' not in host or ' ' in url:
+        raise ValueError("That doesn't look like a link")
+    if _YOUTUBE_HOST_RE.match(host):
+        m = _YOUTUBE_ID_RE.search(url)
+        if m:
+            return f'https://www.youtube.com/watch?v={m.group(1)}'
+        if 'list=' in parts.query:
+            raise ValueError('That is a playlist link; use batch mode to download playlists')
+        raise ValueError('That YouTube link is incomplete (no video ID)')
+    return url
+
+
+class MetadataCache:
+    """Thread-safe LRU/TTL cache of info dicts, backed by an optional shared ``store``."""
+
+    def __init__(self, max_entries=256, ttl=1800, store=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = store
+        self._entries = OrderedDict()  # key -> (fetched_at, info)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached info dict for ``key``, or None.
+
+        The dict is shared between callers; copy it before mutating.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[1]
+        if self.store is None:
+            return None
+        # Looked up, or extracted by another process (or before a restart)
+        try:
+            record = self.store.get('info', key)
+        except Exception:
+            log.warning('Could not read metadata %s from the state store', key, exc_info=True)
+            return None
+        if record is None or now - record['fetched'] > self.ttl:
+            return None
+        with self._lock:
+            self._store(key, (record['fetched'], record['info']))
+        return record['info']
+
+    def put(self, key, info):
+        entry = (time.time(), info)
+        with self._lock:
+            self._store(key, entry)
+        if self.store is None:
+            return
+        try:
+            self.store.put('info', key, {'fetched': entry[0], 'info': info}, ttl=self.ttl)
+        except Exception:
+            log.warning('Could not save metadata %s to the state store', key, exc_info=True)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.store is None:
+            return
+        try:
+            self.store.delete('info', key)
+        except Exception:
+            log.warning('Could not remove metadata %s from the state store', key, exc_info=True)
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+_local = threading.local()
+
+
+def _extractor():
+    # Each YoutubeDL registers every extractor it knows (~80 ms); lookups on
+    # the same thread reuse one instead, as yt-dlp's own CLI does across URLs.
+    # Not shared between threads: an instance keeps per-extraction state.
+    ydl = getattr(_local, 'ydl', None)
+    if ydl is None:
+        import yt_dlp
+        ydl = _local.ydl = yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True})
+    return ydl
+
+
+def preload():
+    """Import yt-dlp on a background thread, ahead of the first lookup."""
+    # Not a daemon: one killed halfway through an import can crash the interpreter's exit
+    threading.Thread(target=lambda: __import__('yt_dlp'), name='ytd-preload').start()
+
+
+def fetch_info(url, cache=None):
+    """Return the full info dict for ``url``, extracting it only on a cache miss."""
+    cache = cache or get_metadata_cache()
+    key = video_key(url)
+    info = cache.get(key)
+    if info is not None:
+        return info
+
+    with get_metrics().timer('metadata'):
+        ydl = _extractor()
+        info = ydl.sanitize_info(ydl.extract_info(url, download=False), remove_private_keys=True)
+    cache.put(key, info)
+    return info
+
+
+def _urls_expired(error):
+    # yt-dlp reports download failures as text, e.g. 'HTTP Error 403: Forbidden'
+    return bool(_EXPIRED_RE.search(str(error)))
+
+
+def download_with_cache(ydl, url, cache=None):
+    """Download ``url`` with ``ydl``, reusing the cached format list when possible."""
+    from yt_dlp.utils import DownloadError
+
+    cache = cache or get_metadata_cache()
+    key = video_key(url)
+    info = cache.get(key)
+    if info is not None:
+        try:
+            return ydl.process_ie_result(copy.deepcopy(info), download=True)
+        except DownloadError as e:
+            if not _urls_expired(e):
+                # A dropped transfer: the caller retries and resumes the partial file
+                raise
+            # The signed format URLs went stale; extract afresh below
+            cache.invalidate(key)
+    info = ydl.extract_info(url, download=True)
+    cache.put(key, ydl.sanitize_info(info, remove_private_keys=True))
+    return info
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_metadata_cache():
+    """Return the process-wide :class:`MetadataCache`."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MetadataCache(config.METADATA_CACHE_SIZE, config.METADATA_TTL, get_state())
+        return _cache
@@ -0,0 +1,179 @@
+"""Per-stage timings of every download, for logs and capacity planning.
+
+Each job is broken into stages (``queue``, ``metadata``, ``download``,
+``merge``/``convert``, ``publish``, ``handoff``/``serve``) and every finished
+stage is recorded with its duration and the bytes it moved.  Observations
+are logged as ``key=value`` lines, kept on the job (``job.timings``) and
+aggregated here into Prometheus histograms plus p50/p95 over a window of
+recent samples, which the file server exposes at ``/metrics``.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from .progress import POSTPROCESSOR_STAGES
+
+log = logging.getLogger(__name__)
+
+# Histogram bucket bounds in seconds: sub-second cache hits up to long merges
+_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+# Recent samples per stage used for the p50/p95 figures
+_WINDOW = 1000
+_QUANTILES = (0.5, 0.95)
+
+
+def _quantile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+class _Stage:
+    def __init__(self):
+        self.buckets = [0] * len(_BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.durations = deque(maxlen=_WINDOW)
+        self.throughputs = deque(maxlen=_WINDOW)
+
+
+class Metrics:
+    """Thread-safe registry of stage timings."""
+
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, nbytes=None, job=None):
+        """Record one finished ``stage`` that took ``seconds`` and moved ``nbytes``."""
+        throughput = nbytes / seconds if nbytes and seconds > 0 else None
+        with self._lock:
+            s = self._stages.get(stage)
+            if s is None:
+                s = self._stages[stage] = _Stage()
+            for i, bound in enumerate(_BUCKETS):
+                if seconds <= bound:
+                    s.buckets[i] += 1
+            s.count += 1
+            s.seconds += seconds
+            s.bytes += nbytes or 0
+            s.durations.append(seconds)
+            if throughput:
+                s.throughputs.append(throughput)
+
+        if job is not None:
+            timings = job.timings
+            timings[stage] = timings.get(stage, 0.0) + seconds
+        log.info('stage=%s job=%s seconds=%.3f bytes=%s throughput=%s', stage,
+                 job.id if job is not None else '-', seconds, nbytes if nbytes else '-',
+                 f'{throughput:.0f}' if throughput else '-')
+
+    @contextmanager
+    def timer(self, stage, job=None):
+        """Time the ``with`` block as ``stage``; set ``.bytes`` on the yielded dict to record size."""
+        record = {'bytes': None}
+        start = time.monotonic()
+        yield record
+        self.observe(stage, time.monotonic() - start, record['bytes'], job)
+
+    def summary(self):
+        """``{stage: {count, seconds, bytes, p50, p95, throughput_p50, throughput_p95}}``."""
+        with self._lock:
+            stages = {name: (s.count, s.seconds, s.bytes, list(s.durations), list(s.throughputs))
+                      for name, s in self._stages.items()}
+        result = {}
+        for name, (count, seconds, nbytes, durations, throughputs) in stages.items():
+            result[name] = {'count': count, 'seconds': seconds, 'bytes': nbytes}
+            for q in _QUANTILES:
+                pct = int(q * 100)
+                result[name][f'p{pct}'] = _quantile(durations, q)
+                result[name][f'throughput_p{pct}'] = _quantile(throughputs, q)
+        return result
+
+    def render(self):
+        """The registry in the Prometheus text exposition format."""
+        with self._lock:
+            stages = sorted(self._stages.items())
+            lines = [
+                '# HELP ytd_stage_duration_seconds Time spent per download stage.',
+                '# TYPE ytd_stage_duration_seconds histogram',
+            ]
+            for name, s in stages:
+                for bound, n in zip(_BUCKETS, s.buckets):
+                    lines.append(f'ytd_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {n}')
+                lines.append(f'ytd_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {s.count}')
+                lines.append(f'ytd_stage_duration_seconds_sum{{stage="{name}"}} {s.seconds:.6f}')
+                lines.append(f'ytd_stage_duration_seconds_count{{stage="{name}"}} {s.count}')
+            lines += [
+                '# HELP ytd_stage_bytes_total Bytes moved per download stage.',
+                '# TYPE ytd_stage_bytes_total counter',
+            ]
+            lines += [f'ytd_stage_bytes_total{{stage="{name}"}} {s.bytes}' for name, s in stages]
+
+        summary = self.summary()
+        for metric, key, help_text in (
+            ('ytd_stage_duration_recent_seconds', 'p', 'Stage duration quantiles over recent jobs.'),
+            ('ytd_stage_throughput_recent_bytes_per_second', 'throughput_p',
+             'Stage throughput quantiles over recent jobs.'),
+        ):
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} gauge']
+            for name in sorted(summary):
+                for q in _QUANTILES:
+                    value = summary[name][f'{key}{int(q * 100)}']
+                    if value is not None:
+                        lines.append(f'{metric}{{stage="{name}",quantile="{q}"}} {value:.6f}')
+        return '\n'.join(lines) + '\n'
+
+
+class StageClock:
+    """yt-dlp hooks that time the download and merge/convert stages of one run."""
+
+    def __init__(self, job=None, metrics=None):
+        self.job = job
+        self.metrics = metrics or get_metrics()
+        self._download_start = None
+        self._download_bytes = 0
+        self._pp_start = {}
+
+    def progress_hook(self, d):
+        if d['status'] == 'downloading':
+            if self._download_start is None:
+                self._download_start = time.monotonic()
+        elif d['status'] == 'finished':
+            self._download_bytes += d.get('total_bytes') or d.get('downloaded_bytes') or 0
+
+    def postprocessor_hook(self, d):
+        name = d.get('postprocessor')
+        stage = POSTPROCESSOR_STAGES.get(name)
+        if stage is None:
+            return
+        if d['status'] == 'started':
+            # Downloads are over once post-processing begins
+            self.finish_download()
+            self._pp_start[name] = time.monotonic()
+        elif d['status'] == 'finished' and name in self._pp_start:
+            self.metrics.observe(stage, time.monotonic() - self._pp_start.pop(name), job=self.job)
+
+    def finish_download(self):
+        """Record the download stage, if one ran and was not recorded yet."""
+        if self._download_start is not None:
+            self.metrics.observe('download', time.monotonic() - self._download_start,
+                                 self._download_bytes, self.job)
+            self._download_start = None
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Return the process-wide :class:`Metrics`."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
@@ -0,0 +1,112 @@
+"""Coalesced progress reporting for yt-dlp downloads.
+
+yt-dlp calls its progress hook for every chunk, which on a fast link is
+hundreds of times a second.  :class:`ProgressReporter` keeps that hot path
+to a clock check, and only every ``interval`` seconds (or on a state change)
+turns the raw numbers into a :class:`ProgressEvent`, stores it on the job
+and hands it to any listeners (metrics, logging, CLI output...).
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from . import config
+
+log = logging.getLogger(__name__)
+
+ProgressEvent = namedtuple('ProgressEvent', 'job_id stage downloaded total speed eta progress detail')
+
+# yt-dlp postprocessors worth showing, and the stage they stand for
+POSTPROCESSOR_STAGES = {'Merger': 'merge', 'ExtractAudio': 'convert'}
+
+_listeners = []
+_listeners_lock = threading.Lock()
+
+
+def subscribe(listener):
+    """Call ``listener(event)`` for progress events of every job in this process."""
+    with _listeners_lock:
+        _listeners.append(listener)
+
+
+def unsubscribe(listener):
+    with _listeners_lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+class ProgressReporter:
+    """Turns yt-dlp progress/postprocessor hooks into throttled job updates."""
+
+    def __init__(self, job, interval=None, listeners=()):
+        self.job = job
+        # How the merge will run ('remux', 'transcode-audio'...), reported with it
+        self.merge_strategy = None
+        self.interval = config.PROGRESS_INTERVAL if interval is None else interval
+        self.listeners = list(listeners)
+        self._last_emit = 0.0
+
+    def progress_hook(self, d):
+        status = d['status']
+        if status == 'downloading':
+            now = time.monotonic()
+            if now - self._last_emit < self.interval:
+                return
+            self._last_emit = now
+            total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            downloaded = d.get('downloaded_bytes') or 0
+            self.emit('download', downloaded, total, d.get('speed'), d.get('eta'))
+        elif status == 'finished':
+            size = d.get('total_bytes') or d.get('downloaded_bytes')
+            self.emit('downloaded', size, size, None, 0)
+
+    def postprocessor_hook(self, d):
+        stage = POSTPROCESSOR_STAGES.get(d.get('postprocessor'))
+        if stage is None:
+            return
+        if d['status'] == 'started':
+            self.emit(stage, detail=self.merge_strategy if stage == 'merge' else None)
+        elif d['status'] == 'finished':
+            self.emit('processed')
+
+    def emit(self, stage, downloaded=None, total=None, speed=None, eta=None, detail=None):
+        if stage == 'download':
+            progress = min(downloaded / total, 1.0) if total else self.job.progress
+        else:
+            progress = 1.0
+        event = ProgressEvent(self.job.id, stage, downloaded, total, speed, eta, progress, detail)
+        self.job.update(stage=stage, progress=progress, speed=speed, eta=eta, detail=detail)
+
+        with _listeners_lock:
+            listeners = self.listeners + _listeners
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception:
+                log.exception('Progress listener failed')
+
+
+def format_bytes(num):
+    if num is None:
+        return '...'
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(num) < 1024:
+            return f'{num:.2f}{unit}'
+        num /= 1024
+    return f'{num:.2f}TiB'
+
+
+def format_speed(bytes_per_second):
+    return '...' if bytes_per_second is None else f'{format_bytes(bytes_per_second)}/s'
+
+
+def format_time(seconds):
+    """``'1:30'`` / ``'1:02:30'`` for a number of seconds."""
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return f'{h}:{m:02d}:{s:02d}' if h else f'{m}:{s:02d}'
+
+
+def format_eta(seconds):
+    return '...' if seconds is None else format_time(seconds)
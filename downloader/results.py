@@ -0,0 +1,264 @@
+"""Content-addressed store of finished downloads.
+
+Results are keyed by (video, format selector, container), so a popular video
+is fetched and merged once and then served straight from disk.  Entries live
+at ``<root>/<key>/<filename>``; they are produced in a per-key work dir and
+published with an atomic ``rename``, concurrent requests for the same key
+wait for the one download already in flight, and the total size is kept
+under ``max_bytes`` by evicting the least recently used entries.
+
+A failed download leaves its work dir (with yt-dlp's ``.part`` files) in
+place for ``config.WORK_DIR_TTL`` seconds, so the next attempt at the same
+key resumes where the last one stopped.
+
+With a shared state store (:mod:`downloader.state`), a per-key lock makes
+other app processes wait for a download already running elsewhere rather
+than repeating it.  The store also records where each finished file is, so a
+process whose own cache dir lacks the entry can still reuse it when that
+path is reachable (a shared volume).
+"""
+import hashlib
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+
+from . import config
+from .state import get_state
+
+log = logging.getLogger(__name__)
+
+# Entries used this recently are never evicted (they may be in the middle of
+# being handed to the delivery store)
+_EVICT_GRACE = 60
+
+_WORK_PREFIX = '.work-'
+
+
+def result_key(video, format_selector, container, variant=''):
+    """Stable cache key for one (video, format, container) combination.
+
+    ``variant`` covers anything else that changes the file, such as an audio
+    bitrate or a clip range (see :func:`~downloader.formats.option_variant`).
+    """
+    raw = '\0'.join((video, format_selector, container or ''))
+    if variant:
+        raw += '\0' + variant
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.path = None
+        self.error = None
+
+
+class ResultCache:
+    """On-disk LRU store of finished files with in-flight request dedup."""
+
+    def __init__(self, root, max_bytes, store=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.store = store
+        self._inflight = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.purge_work_dirs()
+
+    def lookup(self, key):
+        """Return the cached file for ``key`` (marking it recently used), or None."""
+        entry_dir = os.path.join(self.root, key)
+        try:
+            names = os.listdir(entry_dir)
+        except FileNotFoundError:
+            names = None
+        if not names:
+            return self._lookup_elsewhere(key)
+        try:
+            os.utime(entry_dir)
+        except OSError:
+            pass
+        return os.path.join(entry_dir, names[0])
+
+    def _lookup_elsewhere(self, key):
+        # Made by another process with its own cache dir, maybe on a shared volume
+        if self.store is None:
+            return None
+        try:
+            record = self.store.get('result', key)
+        except Exception:
+            log.warning('Could not read result %s from the state store', key, exc_info=True)
+            return None
+        if not record or not os.path.isfile(record['path']):
+            return None
+        try:
+            os.utime(os.path.dirname(record['path']))
+        except OSError:
+            pass
+        return record['path']
+
+    def get_or_create(self, key, produce, on_wait=None):
+        """Return the file for ``key``, calling ``produce`` only if nobody else is.
+
+        ``produce(work_dir)`` downloads into ``work_dir`` and returns the path
+        of the finished file (or None).  Callers that find the same key already
+        in flight block until that download finishes and share its result;
+        ``on_wait`` is called first so the UI can say so.
+        """
+        path = self.lookup(key)
+        if path:
+            return path
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if not leader:
+            if on_wait:
+                on_wait()
+            flight.done.wait()
+            if flight.error:
+                raise flight.error
+            return self.lookup(key)
+
+        try:
+            flight.path = self._produce_shared(key, produce, on_wait)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.done.set()
+        return flight.path
+
+    def work_dir(self, key):
+        """Where ``key`` is downloaded; survives failures so it can be resumed."""
+        return os.path.join(self.root, _WORK_PREFIX + key)
+
+    def _produce_shared(self, key, produce, on_wait):
+        if self.store is None:
+            return self._produce(key, produce)
+        try:
+            lock = self.store.lock(f'result-{key}')
+            if not lock.acquire(blocking=False):
+                # Another app process is downloading this very file
+                if on_wait:
+                    on_wait()
+                lock.acquire()
+        except Exception:
+            log.warning('State store unavailable, downloading %s without cross-process dedup', key, exc_info=True)
+            return self._produce(key, produce)
+        try:
+            return self.lookup(key) or self._produce(key, produce)
+        finally:
+            lock.release()
+
+    def _produce(self, key, produce):
+        work_dir = self.work_dir(key)
+        os.makedirs(work_dir, exist_ok=True)
+        # Touched so an old but resumed dir is not purged under our feet
+        os.utime(work_dir)
+        path = produce(work_dir)
+        if not path:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            return None
+        try:
+            filename = os.path.basename(path)
+            # Keep only the finished file, then publish the whole dir in one rename
+            for name in os.listdir(work_dir):
+                if name != filename:
+                    victim = os.path.join(work_dir, name)
+                    if os.path.isdir(victim):
+                        shutil.rmtree(victim, ignore_errors=True)
+                    else:
+                        os.remove(victim)
+            entry_dir = os.path.join(self.root, key)
+            try:
+                os.rename(work_dir, entry_dir)
+            except OSError:
+                # Published by another process meanwhile; keep theirs
+                if not os.path.isdir(entry_dir):
+                    raise
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        self.evict()
+        self.purge_work_dirs()
+        path = self.lookup(key)
+        if path and self.store is not None:
+            try:
+                self.store.put('result', key, {'path': path, 'size': os.path.getsize(path),
+                                               'host': socket.gethostname()})
+            except Exception:
+                log.warning('Could not record result %s in the state store', key, exc_info=True)
+        return path
+
+    def evict(self):
+        """Drop least recently used entries until the store fits ``max_bytes``."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.root):
+            if name.startswith('.'):
+                continue
+            entry_dir = os.path.join(self.root, name)
+            try:
+                size = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+                entries.append((os.path.getmtime(entry_dir), size, entry_dir))
+            except OSError:
+                continue
+            total += size
+
+        now = time.time()
+        for mtime, size, entry_dir in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if now - mtime < _EVICT_GRACE:
+                continue
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            log.info('Evicted cached result %s (%d bytes)', os.path.basename(entry_dir), size)
+            self._forget(os.path.basename(entry_dir), entry_dir)
+
+    def _forget(self, key, entry_dir):
+        # Only if the record points here: another process may hold its own copy
+        if self.store is None:
+            return
+        try:
+            record = self.store.get('result', key)
+            if record and os.path.dirname(record['path']) == entry_dir:
+                self.store.delete('result', key)
+        except Exception:
+            log.warning('Could not remove result %s from the state store', key, exc_info=True)
+
+    def purge_work_dirs(self):
+        """Remove partial downloads nobody resumed within ``WORK_DIR_TTL``."""
+        cutoff = time.time() - config.WORK_DIR_TTL
+        with self._lock:
+            busy = {self.work_dir(key) for key in self._inflight}
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not name.startswith(_WORK_PREFIX) or path in busy:
+                continue
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                continue
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Return the process-wide :class:`ResultCache`."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache(config.RESULT_CACHE_DIR, config.RESULT_CACHE_MAX_BYTES, get_state())
+        return _cache
@@ -0,0 +1,210 @@
+"""Shared state for running several app processes side by side.
+
+Job records, metadata cache entries and the locations of finished files are
+kept in a store that every process can reach.  By default that is a SQLite
+file under ``DATA_DIR``, with file locks, for processes on one machine.  For
+several machines, set ``YTD_STATE_URL=redis://...`` (needs the ``redis``
+package) and put ``YTD_DATA_DIR`` on a shared volume.  A refreshed page
+that lands on another process then still finds its job.  Two processes
+asked for the same video download it only once, and any of them can hand
+out the finished file.
+
+Values are JSON-serializable dicts, grouped by namespace (``'job'``,
+``'batch'``, ``'info'``, ``'result'``), with an optional TTL in seconds.
+:meth:`lock` returns a lock that is exclusive across every process using
+the store.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+
+from . import config
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only hold within this process
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+# Expired rows are deleted every this many writes
+_PURGE_EVERY = 500
+
+
+class _FileLock:
+    """``flock`` on ``path``, also exclusive between threads of this process."""
+
+    _local = {}  # path -> threading.Lock, since flock does not exclude our own threads
+    _local_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        with self._local_lock:
+            self._thread_lock = self._local.setdefault(path, threading.Lock())
+        self._file = None
+
+    def acquire(self, blocking=True):
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if fcntl is None:
+            return True
+        self._file = open(self.path, 'a')
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            self._file.close()
+            self._thread_lock.release()
+            return False
+        return True
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class LocalStore:
+    """SQLite-backed store with file locks, for processes sharing one filesystem."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock_dir = os.path.join(os.path.dirname(os.path.abspath(path)), 'locks')
+        os.makedirs(self._lock_dir, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS kv '
+                         '(ns TEXT, key TEXT, value TEXT, expires REAL, PRIMARY KEY (ns, key))')
+        self._db.commit()
+        self._mutex = threading.Lock()
+        self._writes = 0
+        self.purge()
+
+    def get(self, ns, key):
+        with self._mutex:
+            row = self._db.execute('SELECT value, expires FROM kv WHERE ns = ? AND key = ?', (ns, key)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return json.loads(row[0])
+
+    def put(self, ns, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        with self._mutex:
+            self._db.execute('INSERT OR REPLACE INTO kv VALUES (?, ?, ?, ?)', (ns, key, json.dumps(value), expires))
+            self._db.commit()
+            self._writes += 1
+            purge = self._writes % _PURGE_EVERY == 0
+        if purge:
+            self.purge()
+
+    def delete(self, ns, key):
+        with self._mutex:
+            self._db.execute('DELETE FROM kv WHERE ns = ? AND key = ?', (ns, key))
+            self._db.commit()
+
+    def lock(self, name):
+        return _FileLock(os.path.join(self._lock_dir, f'{name}.lock'))
+
+    def purge(self):
+        with self._mutex:
+            self._db.execute('DELETE FROM kv WHERE expires < ?', (time.time(),))
+            self._db.commit()
+
+
+class _RedisLock:
+    """Redis lock whose lease is renewed while held, so a crashed holder frees it."""
+
+    def __init__(self, lock):
+        self._lock = lock
+        self._stop = threading.Event()
+
+    def acquire(self, blocking=True):
+        if not self._lock.acquire(blocking=blocking):
+            return False
+        self._stop.clear()
+        threading.Thread(target=self._renew, name='ytd-lock-renew', daemon=True).start()
+        return True
+
+    def _renew(self):
+        while not self._stop.wait(self._lock.timeout / 3):
+            try:
+                self._lock.reacquire()
+            except Exception:
+                log.warning('Lost lock %s', self._lock.name, exc_info=True)
+                return
+
+    def release(self):
+        self._stop.set()
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class RedisStore:
+    """Store in Redis (or anything speaking its protocol), for processes on several machines."""
+
+    def __init__(self, url, prefix='ytd', lease=60):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('YTD_STATE_URL is a redis:// URL but the redis package is missing '
+                               '(pip install redis)') from None
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.lease = lease
+
+    def _key(self, ns, key):
+        return f'{self.prefix}:{ns}:{key}'
+
+    def get(self, ns, key):
+        value = self.client.get(self._key(ns, key))
+        return json.loads(value) if value is not None else None
+
+    def put(self, ns, key, value, ttl=None):
+        self.client.set(self._key(ns, key), json.dumps(value), ex=int(ttl) if ttl else None)
+
+    def delete(self, ns, key):
+        self.client.delete(self._key(ns, key))
+
+    def lock(self, name):
+        return _RedisLock(self.client.lock(self._key('lock', name), timeout=self.lease, thread_local=False))
+
+
+def make_store(url):
+    """Build the store for a ``YTD_STATE_URL`` value: ``redis://...`` or a SQLite file (``sqlite:///path``)."""
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStore(url)
+    if url.startswith('sqlite://'):
+        url = urlsplit(url).path
+    return LocalStore(url)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_state():
+    """Return the process-wide store."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = make_store(config.STATE_URL)
+        return _store
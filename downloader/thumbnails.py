@@ -0,0 +1,200 @@
+"""Thumbnail proxy for the result card.
+
+The card used to embed the extractor's thumbnail URL directly, so every
+browser fetched the full-size upstream image itself (revealing its IP to the
+CDN) and nothing was cached.  Thumbnails are now fetched once by the server,
+the smallest variant at least ``THUMBNAIL_WIDTH`` pixels wide, downsized to
+that width and re-encoded as WebP (JPEG when Pillow lacks WebP), and kept
+in a small on-disk LRU cache.  The page embeds them as ``data:`` URIs, so the
+browser never talks to the upstream host.  Without Pillow the chosen
+variant is cached as it is.
+
+Only the metadata lookup (:mod:`downloader.lookup`) fetches; the script run
+reads from the cache and never waits on the upstream host.
+"""
+import base64
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+import urllib.request
+
+from . import config
+from .metrics import get_metrics
+
+log = logging.getLogger(__name__)
+
+# Refuse upstream images larger than this (no thumbnail comes close)
+_MAX_FETCH = 8 * 1024 * 1024
+_FETCH_TIMEOUT = 10
+_MIME = {'.webp': 'image/webp', '.jpg': 'image/jpeg', '.png': 'image/png', '.gif': 'image/gif'}
+
+
+def pick_thumbnail(info, width):
+    """URL of the smallest thumbnail in ``info`` at least ``width`` px wide.
+
+    Falls back to the widest one known, then to ``info['thumbnail']``.
+    """
+    candidates = [t for t in info.get('thumbnails') or () if t.get('url') and t.get('width')]
+    if candidates:
+        wide_enough = [t for t in candidates if t['width'] >= width]
+        if wide_enough:
+            return min(wide_enough, key=lambda t: t['width'])['url']
+        return max(candidates, key=lambda t: t['width'])['url']
+    return info.get('thumbnail')
+
+
+class ThumbnailCache:
+    """On-disk LRU cache of resized thumbnails, ``<root>/<key><ext>``."""
+
+    def __init__(self, root, max_bytes, width):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.width = width
+        self._inflight = {}  # key -> lock held by the thread fetching it
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def get(self, url):
+        """Return the cached file for ``url``, fetching it on a miss; None on failure."""
+        key = _key(url)
+        if key is None:
+            return None
+        path = self._lookup(key)
+        if path:
+            return path
+        with self._lock:
+            flight = self._inflight.setdefault(key, threading.Lock())
+        with flight:
+            # Whoever held the lock before us may have fetched it already
+            path = self._lookup(key)
+            if path:
+                return path
+            try:
+                return self._fetch(key, url)
+            except Exception as e:
+                log.warning('Could not fetch thumbnail %s: %s', url, e)
+                return None
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+    def cached(self, url):
+        """Return the cached file for ``url`` without fetching it, or None."""
+        key = _key(url)
+        return self._lookup(key) if key else None
+
+    def data_uri(self, url):
+        """The cached thumbnail for ``url`` as a ``data:`` URI, or None (never fetches)."""
+        path = self.cached(url)
+        if not path:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        mime = _MIME.get(os.path.splitext(path)[1], 'application/octet-stream')
+        return f'data:{mime};base64,{base64.b64encode(data).decode("ascii")}'
+
+    def _lookup(self, key):
+        for ext in _MIME:
+            path = os.path.join(self.root, key + ext)
+            try:
+                os.utime(path)
+            except OSError:
+                continue
+            return path
+        return None
+
+    def _fetch(self, key, url):
+        with get_metrics().timer('thumbnail') as record:
+            request = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
+            with urllib.request.urlopen(request, timeout=_FETCH_TIMEOUT) as response:
+                data = response.read(_MAX_FETCH + 1)
+                content_type = response.headers.get_content_type()
+            if len(data) > _MAX_FETCH:
+                raise ValueError('image too large')
+            record['bytes'] = len(data)
+            data, ext = self._shrink(data, content_type)
+
+        path = os.path.join(self.root, key + ext)
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self.evict(keep=path)
+        return path
+
+    def _shrink(self, data, content_type):
+        # Imported here, not at the top: only lookups fetching a thumbnail need it
+        try:
+            from PIL import Image, features
+        except ImportError:
+            ext = {v: k for k, v in _MIME.items()}.get(content_type)
+            if not ext:
+                raise ValueError(f'unexpected content type {content_type}')
+            return data, ext
+        with Image.open(io.BytesIO(data)) as img:
+            # JPEG can decode straight to a reduced size, which is much faster
+            img.draft('RGB', (self.width, self.width))
+            img = img.convert('RGB')
+            if img.width > self.width:
+                img = img.resize((self.width, round(img.height * self.width / img.width)), Image.LANCZOS)
+            out = io.BytesIO()
+            if features.check('webp'):
+                img.save(out, 'WEBP', quality=80, method=4)
+                return out.getvalue(), '.webp'
+            img.save(out, 'JPEG', quality=82, optimize=True, progressive=True)
+            return out.getvalue(), '.jpg'
+
+    def evict(self, keep=None):
+        """Remove least recently used thumbnails until the cache fits ``max_bytes``."""
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if name.endswith('.tmp'):
+                # Left behind by a crash mid-write
+                if time.time() - st.st_mtime > 60:
+                    _remove(path)
+                continue
+            if path != keep:
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries) + (os.path.getsize(keep) if keep else 0)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            _remove(path)
+            total -= size
+
+
+def _key(url):
+    if not url or not url.startswith(('http://', 'https://')):
+        return None
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_thumbnails():
+    """Return the process-wide :class:`ThumbnailCache`."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ThumbnailCache(config.THUMBNAIL_DIR, config.THUMBNAIL_CACHE_MAX_BYTES, config.THUMBNAIL_WIDTH)
+        return _cache
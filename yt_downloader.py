@@ -1,10 +1,19 @@
 import streamlit as st
-import yt_dlp
+import mimetypes
 import os
-import tempfile
 import time
-import shutil
-import re
+import urllib.request
+import uuid
+
+from downloader import (
+    clip_option, download_job, expand_urls, format_options, format_time, get_batch, get_delivery, get_ffmpeg_path, get_job_queue,
+    get_thumbnails, normalize_url, option_label, parse_time, pick_thumbnail, preload, start_batch, start_lookup,
+)
+from downloader.jobs import FAILED, QUEUED, QueueFull
+from downloader.governor import get_memory_budget
+from downloader.metrics import get_metrics
+from downloader.config import INLINE_HOLD, INLINE_LIMIT, PROGRESS_INTERVAL
+from downloader.progress import format_eta, format_speed
 
 # 1. Page Configuration
 st.set_page_config(
@@ -18,292 +27,32 @@ if 'video_info' not in st.session_state:
     st.session_state.video_info = None
 if 'current_url' not in st.session_state:
     st.session_state.current_url = ""
-
-# 3. Smart FFmpeg Detection
-def get_ffmpeg_path():
-    # Try getting ffmpeg from imageio_ffmpeg
-    try:
-        from imageio_ffmpeg import get_ffmpeg_exe
-        path = get_ffmpeg_exe()
-        if path and os.path.exists(path): return path
-    except ImportError: pass
-
-    # Try getting ffmpeg from static_ffmpeg
-    try:
-        import static_ffmpeg
-        static_ffmpeg.add_paths()
-    except ImportError: pass
-
-    # Check common paths
-    cwd = os.getcwd()
-    possible_paths = [
-        os.path.join(cwd, 'ffmpeg'), os.path.join(cwd, 'ffmpeg.exe'),
-        os.path.join(cwd, 'bin', 'ffmpeg'), os.path.join(cwd, 'bin', 'ffmpeg.exe'),
-    ]
-    for path in possible_paths:
-        if os.path.exists(path) and os.access(path, os.X_OK): return path
-    
-    # Check system path
-    return shutil.which('ffmpeg')
-
+if 'job_id' not in st.session_state:
+    # Re-attach to a running download after a browser refresh
+    st.session_state.job_id = st.query_params.get('job')
+if 'batch_id' not in st.session_state:
+    st.session_state.batch_id = st.query_params.get('batch')
+if 'celebrated' not in st.session_state:
+    st.session_state.celebrated = None
+if 'lookup' not in st.session_state:
+    st.session_state.lookup = None  # metadata lookup running in the background
+if 'session_id' not in st.session_state:
+    # Identifies this browser session to the job queue and the memory budget
+    st.session_state.session_id = uuid.uuid4().hex
+if 'inline_since' not in st.session_state:
+    st.session_state.inline_since = None  # (job id, time) the file went into memory
+
+# 3. Smart FFmpeg Detection (probed once per process, remembered across restarts)
 FFMPEG_PATH = get_ffmpeg_path()
 
-# 4. Custom CSS (Aesthetic Aurora UI)
-st.markdown("""
-<style>
-    @import url('https://fonts.googleapis.com/css2?family=Plus+Jakarta+Sans:wght@400;500;600;700;800&display=swap');
-
-    /* Global Reset & Base */
-    .stApp {
-        background-color: #030014; /* Deep space dark */
-        background-image: 
-            radial-gradient(circle at 50% -20%, #4c1d95 0%, transparent 40%),
-            radial-gradient(circle at 100% 40%, #1e1b4b 0%, transparent 30%),
-            radial-gradient(circle at 0% 40%, #1e1b4b 0%, transparent 30%);
-        color: #e2e8f0;
-        font-family: 'Plus Jakarta Sans', sans-serif;
-    }
-
-    /* Clean up Streamlit padding */
-    .block-container {
-        padding-top: 3.5rem;
-        padding-bottom: 5rem;
-        max-width: 760px;
-    }
-
-    /* Header Styling */
-    .header-container {
-        text-align: center;
-        margin-bottom: 4rem;
-        animation: fadeDown 1s cubic-bezier(0.2, 0.8, 0.2, 1);
-        padding: 0 1rem;
-    }
-    
-    .main-title {
-        font-size: 4rem;
-        font-weight: 800;
-        background: linear-gradient(135deg, #fff 0%, #c4b5fd 50%, #818cf8 100%);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        letter-spacing: -0.04em;
-        margin-bottom: 0.75rem;
-        text-shadow: 0 0 40px rgba(129, 140, 248, 0.3);
-        line-height: 1.1;
-    }
-    
-    .subtitle {
-        color: #94a3b8;
-        font-size: 1.2rem;
-        font-weight: 500;
-        letter-spacing: 0.01em;
-        background: rgba(255,255,255,0.05);
-        display: inline-block;
-        padding: 6px 16px;
-        border-radius: 50px;
-        border: 1px solid rgba(255,255,255,0.05);
-        backdrop-filter: blur(5px);
-    }
-
-    /* INPUT & SEARCH BUTTON STYLING */
-    /* Target the text input box */
-    .stTextInput > div > div > input {
-        background-color: rgba(15, 23, 42, 0.6) !important;
-        border: 1px solid rgba(148, 163, 184, 0.2) !important;
-        color: white !important;
-        border-radius: 16px !important;
-        padding: 14px 20px !important;
-        font-size: 1.05rem !important;
-        transition: all 0.3s cubic-bezier(0.4, 0, 0.2, 1);
-        backdrop-filter: blur(10px);
-    }
-    
-    .stTextInput > div > div > input:focus {
-        border-color: #818cf8 !important; /* Indigo 400 */
-        box-shadow: 0 0 0 4px rgba(129, 140, 248, 0.15) !important;
-        background-color: rgba(15, 23, 42, 0.9) !important;
-        transform: translateY(-1px);
-    }
-
-    /* Primary Search Button */
-    div[data-testid="column"] .stButton button {
-        border-radius: 16px !important;
-        font-weight: 700 !important;
-        border: none !important;
-        padding: 0.6rem 1rem !important;
-        transition: all 0.3s cubic-bezier(0.4, 0, 0.2, 1) !important;
-        text-transform: uppercase;
-        letter-spacing: 0.05em;
-        font-size: 0.9rem !important;
-        height: auto !important;
-        min-height: 54px;
-        background: linear-gradient(135deg, #4f46e5 0%, #3730a3 100%) !important;
-        box-shadow: 0 4px 15px rgba(79, 70, 229, 0.3);
-    }
-    
-    .stButton > button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 8px 25px rgba(79, 70, 229, 0.5);
-    }
-    
-    .stButton > button:active {
-        transform: translateY(0px);
-    }
-
-    /* RESULT CARD STYLING */
-    /* Targeting the specific container with border=True */
-    div[data-testid="stVerticalBlockBorderWrapper"] {
-        background: rgba(15, 23, 42, 0.4);
-        backdrop-filter: blur(24px);
-        -webkit-backdrop-filter: blur(24px);
-        border: 1px solid rgba(255, 255, 255, 0.08);
-        border-radius: 28px;
-        padding: 28px;
-        margin-top: 2rem;
-        box-shadow: 0 20px 40px -10px rgba(0, 0, 0, 0.4);
-        animation: slideUp 0.6s cubic-bezier(0.2, 0.8, 0.2, 1);
-        position: relative;
-        overflow: hidden;
-    }
-    
-    /* Add a subtle glow accent to the top of the card */
-    div[data-testid="stVerticalBlockBorderWrapper"]::before {
-        content: '';
-        position: absolute;
-        top: 0;
-        left: 0;
-        right: 0;
-        height: 1px;
-        background: linear-gradient(90deg, transparent, rgba(129, 140, 248, 0.5), transparent);
-    }
-
-    /* Hide the default generic border color if possible, handled by border above */
-    
-    .video-title {
-        font-size: 1.5rem;
-        font-weight: 700;
-        line-height: 1.3;
-        color: #f8fafc;
-        margin-bottom: 16px;
-        text-shadow: 0 2px 10px rgba(0,0,0,0.5);
-    }
-
-    .thumbnail-img {
-        border-radius: 16px;
-        width: 100%;
-        box-shadow: 0 8px 20px rgba(0,0,0,0.4);
-        border: 1px solid rgba(255,255,255,0.1);
-        transition: transform 0.3s ease;
-    }
-    
-    .thumbnail-img:hover {
-        transform: scale(1.02);
-    }
-
-    /* Tags */
-    .meta-tags {
-        display: flex;
-        flex-wrap: wrap;
-        gap: 10px;
-        margin-bottom: 24px;
-    }
-    
-    .tag {
-        background: rgba(30, 41, 59, 0.6);
-        color: #cbd5e1;
-        padding: 6px 14px;
-        border-radius: 10px;
-        font-size: 0.85rem;
-        font-weight: 600;
-        border: 1px solid rgba(255,255,255,0.05);
-        display: flex;
-        align-items: center;
-        gap: 6px;
-        transition: background 0.2s;
-    }
-    
-    .tag:hover {
-        background: rgba(30, 41, 59, 0.9);
-        color: #fff;
-    }
-
-    /* Action Button (Download) */
-    .download-action button {
-        background: linear-gradient(135deg, #2563eb 0%, #1d4ed8 100%) !important;
-        border: 1px solid rgba(255,255,255,0.1) !important;
-        color: white !important;
-        box-shadow: 0 10px 20px -5px rgba(37, 99, 235, 0.4);
-        width: 100%;
-        font-size: 1.1rem !important;
-        padding: 0.8rem !important;
-        border-radius: 16px !important;
-        font-weight: 600 !important;
-    }
-    .download-action button:hover {
-        box-shadow: 0 15px 30px -5px rgba(37, 99, 235, 0.5);
-        filter: brightness(1.1);
-        transform: translateY(-2px);
-    }
-    
-    /* Success Button Highlight (Updated) */
-    .save-file-btn button {
-        background: linear-gradient(135deg, #059669 0%, #10b981 50%, #34d399 100%) !important;
-        background-size: 200% auto !important;
-        color: white !important;
-        border: 1px solid rgba(255,255,255,0.3) !important;
-        box-shadow: 0 0 20px rgba(16, 185, 129, 0.5);
-        border-radius: 18px !important;
-        font-weight: 800 !important;
-        font-size: 1.2rem !important;
-        padding: 1rem 2rem !important;
-        transition: all 0.4s ease !important;
-        animation: pulse-glow 2s infinite;
-    }
-    
-    .save-file-btn button:hover {
-        background-position: right center !important;
-        transform: translateY(-4px) scale(1.02) !important;
-        box-shadow: 0 15px 40px rgba(16, 185, 129, 0.7) !important;
-    }
-    
-    @keyframes pulse-glow {
-        0% { box-shadow: 0 0 0 0 rgba(16, 185, 129, 0.6); }
-        70% { box-shadow: 0 0 0 14px rgba(16, 185, 129, 0); }
-        100% { box-shadow: 0 0 0 0 rgba(16, 185, 129, 0); }
-    }
-
-    /* Text Pulse Animation */
-    @keyframes text-pulse {
-        0% { opacity: 1; }
-        50% { opacity: 0.6; }
-        100% { opacity: 1; }
-    }
-
-    /* Streamlit Standard Progress Bar Override */
-    .stProgress > div > div > div > div {
-        background-image: linear-gradient(90deg, #818cf8, #c4b5fd);
-        height: 10px;
-        border-radius: 10px;
-    }
-    
-    div[data-testid="stStatusWidget"] {
-        background-color: rgba(15, 23, 42, 0.8);
-        border: 1px solid rgba(255,255,255,0.1);
-        color: #e2e8f0;
-        border-radius: 16px;
-    }
-
-    /* Animations */
-    @keyframes fadeDown {
-        from { opacity: 0; transform: translateY(-30px); filter: blur(5px); }
-        to { opacity: 1; transform: translateY(0); filter: blur(0); }
-    }
-    @keyframes slideUp {
-        from { opacity: 0; transform: translateY(30px); filter: blur(5px); }
-        to { opacity: 1; transform: translateY(0); filter: blur(0); }
-    }
-
-</style>
-""", unsafe_allow_html=True)
+# 4. Custom CSS (Aesthetic Aurora UI), read from disk once per process; it is
+# still sent on every run, since elements a run leaves out are removed
+@st.cache_resource
+def load_css():
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'style.css'), encoding='utf-8') as f:
+        return f"<style>\n{f.read()}</style>"
+
+st.markdown(load_css(), unsafe_allow_html=True)
 
 # 5. Header
 st.markdown("""
@@ -316,7 +65,100 @@ st.markdown("""
 if not FFMPEG_PATH:
     st.warning("⚠️ FFmpeg not found. Merging capabilities are limited.", icon="⚠️")
 
-# 6. Search Section
+@st.cache_resource
+def warm_up():
+    # yt-dlp is imported on first use; do that in the background once the page
+    # is up rather than in the first search
+    preload()
+
+warm_up()
+
+# 6. Batch Mode (playlists, channels, lists of links)
+def batch_rows(batch):
+    rows = []
+    for item, job in zip(batch.items, batch.jobs()):
+        if item.error:
+            state, progress = f"❌ {item.error}", 0.0
+        elif job is None:
+            state, progress = "🔍 Looking up...", 0.0
+        elif job.state == QUEUED:
+            state, progress = "⏳ Queued", 0.0
+        elif job.state == FAILED:
+            state, progress = f"❌ {job.error}", job.progress
+        elif job.done and batch.done and not item.bundled:
+            state, progress = "⚠️ Done, but missing from the ZIP", 1.0
+        elif job.done:
+            state, progress = "✅ Done", 1.0
+        else:
+            state, progress = "⚙️ Processing" if job.stage in ('merge', 'convert') else "📥 Downloading", job.progress
+        rows.append({"Title": item.title, "Status": state, "Progress": progress})
+    return rows
+
+def show_batch_table(batch):
+    st.dataframe(
+        batch_rows(batch),
+        hide_index=True,
+        use_container_width=True,
+        column_config={"Progress": st.column_config.ProgressColumn("Progress", min_value=0.0, max_value=1.0)},
+    )
+
+@st.fragment(run_every=PROGRESS_INTERVAL)
+def batch_progress(batch_id):
+    batch = get_batch(batch_id)
+    if batch is None or batch.done:
+        st.rerun()
+    finished = sum(1 for job in batch.jobs() if job and job.done)
+    with st.status(f"🚀 Batch running: {finished}/{len(batch.items)} finished", expanded=True):
+        show_batch_table(batch)
+
+batch_mode = st.toggle("📚 Batch mode (playlists, channels & multiple links)", value=bool(st.session_state.batch_id))
+
+if batch_mode:
+    batch_text = st.text_area("Links", placeholder="Paste a playlist / channel URL, or one video link per line...", height=140)
+    if st.button("Start Batch", use_container_width=True) and batch_text.strip():
+        with st.spinner("📚 Expanding playlist..."):
+            try:
+                urls = expand_urls(batch_text)
+            except Exception:
+                urls = []
+                st.error("Failed to read the links. Please check the playlist / channel URL.")
+        if urls:
+            try:
+                batch = start_batch(urls, FFMPEG_PATH, owner=st.session_state.session_id)
+            except QueueFull as e:
+                st.warning(f"🚦 {e}. Please wait for it to finish.")
+            else:
+                st.session_state.batch_id = batch.id
+                st.query_params['batch'] = batch.id
+
+    batch = get_batch(st.session_state.batch_id) if st.session_state.batch_id else None
+    if batch and not batch.done:
+        batch_progress(batch.id)
+    elif batch:
+        st.status(f"✅ Batch finished: {batch.bundle['count'] if batch.bundle else 0}/{len(batch.items)} videos", state="complete", expanded=False)
+        if batch.missing:
+            st.warning(f"{len(batch.missing)} of {len(batch.items)} videos are not in the ZIP (see the table below).")
+        show_batch_table(batch)
+        delivery = get_delivery()
+        zip_url = None
+        if batch.bundle and delivery.store.resolve_dir(batch.bundle['token']):
+            zip_url = delivery.zip_link(batch.bundle['token'], batch.bundle['filename'], host=st.context.headers.get('Host'))
+        elif batch.bundle and batch.bundle.get('public_server'):
+            # Kept by another app process that does not share our data dir
+            zip_url = batch.bundle['public_server'] + delivery.store.zip_url_path(batch.bundle['token'], batch.bundle['filename'])
+        if zip_url:
+            col_spacer, col_btn, col_spacer2 = st.columns([1, 2, 1])
+            with col_btn:
+                st.link_button(f"💾 Save all as '{batch.bundle['filename']}'", url=zip_url, use_container_width=True)
+        elif batch.bundle and not batch.remote:
+            st.warning("The ZIP download needs the built-in file server, which is not running.")
+        elif batch.bundle:
+            st.info("⌛ This ZIP is no longer available here. Please start the batch again.")
+
+    # Batch mode replaces the single-video UI below
+    st.stop()
+
+# 7. Search Section
 # We use vertical_alignment="bottom" to ensure the button aligns perfectly with the input box
 input_col, btn_col = st.columns([1, 0.25], gap="medium", vertical_alignment="bottom")
 
@@ -332,37 +174,58 @@ if search_clicked or (url_input and url_input != st.session_state.current_url):
     if url_input:
         st.session_state.current_url = url_input
         st.session_state.video_info = None
+        st.session_state.job_id = None
+        st.query_params.pop('job', None)
+        get_memory_budget().release(st.session_state.session_id)
         
-        with st.spinner("✨ Fetching magic..."):
-            try:
-                ydl_opts_meta = {'quiet': True, 'no_warnings': True}
-                with yt_dlp.YoutubeDL(ydl_opts_meta) as ydl:
-                    info = ydl.extract_info(url_input, download=False)
-                    st.session_state.video_info = {
-                        'title': info.get('title', 'Unknown'),
-                        'thumbnail': info.get('thumbnail', None),
-                        'uploader': info.get('uploader', 'Unknown'),
-                        'duration': info.get('duration', 0),
-                        'views': info.get('view_count', 0),
-                        'url': url_input
-                    }
-            except Exception as e:
-                st.error(f"Failed to fetch metadata. Please check the URL.")
-                st.session_state.current_url = ""
-
-# 7. Result Section
+        try:
+            # Cheap check (and video ID parsing) before any extractor call
+            url = normalize_url(url_input)
+        except ValueError as e:
+            if st.session_state.lookup:
+                st.session_state.lookup.cancel()
+            st.session_state.lookup = None
+            st.error(f"⚠️ {e}")
+        else:
+            # Runs in the background; replaces (and cancels) any lookup still pending
+            st.session_state.lookup = start_lookup(url, previous=st.session_state.lookup)
+
+@st.fragment(run_every=PROGRESS_INTERVAL)
+def lookup_progress():
+    # Polls the lookup; a full rerun shows the result card once it is done
+    lookup = st.session_state.lookup
+    if lookup is None or lookup.done:
+        st.rerun()
+    st.status("✨ Fetching magic...", state="running", expanded=False)
+
+lookup = st.session_state.lookup
+if lookup is not None and not lookup.done:
+    lookup_progress()
+elif lookup is not None:
+    st.session_state.lookup = None
+    try:
+        # Served from the process-wide cache when anyone looked this video up recently
+        info = lookup.result()
+        thumbnails = get_thumbnails()
+        st.session_state.video_info = {
+            'title': info.get('title', 'Unknown'),
+            # Downsized copy the lookup put in our cache (never fetched here), so the browser never hits the CDN
+            'thumbnail': thumbnails.data_uri(pick_thumbnail(info, thumbnails.width)),
+            'uploader': info.get('uploader', 'Unknown'),
+            'duration': info.get('duration', 0),
+            'views': info.get('view_count', 0),
+            'url': lookup.url,
+            'options': format_options(info)
+        }
+    except Exception:
+        # Search again (the button) to retry
+        st.error("Failed to fetch metadata. Please check the URL.")
+
+# 8. Result Section
 if st.session_state.video_info:
     info = st.session_state.video_info
     
-    # Calculate duration string
-    duration_str = "N/A"
-    if info['duration']:
-        m, s = divmod(info['duration'], 60)
-        h, m = divmod(m, 60)
-        if h > 0:
-            duration_str = f"{int(h)}:{int(m):02d}:{int(s):02d}"
-        else:
-            duration_str = f"{int(m)}:{int(s):02d}"
+    duration_str = format_time(info['duration']) if info['duration'] else "N/A"
             
     views_str = f"{info['views']:,}" if info['views'] else "N/A"
 
@@ -393,138 +256,237 @@ if st.session_state.video_info:
             # Spacer
             st.write("")
             
+            # Quality picker, built from the format list fetched with the metadata
+            options = info['options']
+            choice = st.selectbox("Quality", range(len(options)), format_func=lambda i: option_label(options[i]))
+            option = options[choice]
+
+            # Optional clip: only that part of the video is downloaded (keyed per video, so it resets)
+            clip_error = None
+            if st.toggle("✂️ Only part of it", key=f"clip_on_{info['url']}"):
+                c_from, c_to = st.columns(2)
+                clip_from = c_from.text_input("From", value="0:00", key=f"clip_from_{info['url']}")
+                clip_to = c_to.text_input("To", value=format_time(info['duration']) if info['duration'] else "",
+                                          key=f"clip_to_{info['url']}")
+                try:
+                    option = clip_option(option, parse_time(clip_from), parse_time(clip_to), info['duration'])
+                except ValueError as e:
+                    clip_error = str(e)
+                    st.caption(f"⚠️ {clip_error}")
+            
             # Download Action
             st.markdown('<div class="download-action">', unsafe_allow_html=True)
             # Using a unique key to prevent state issues
-            download_clicked = st.button("Download High Quality MP4", key="dl_btn", use_container_width=True)
+            download_clicked = st.button(f"Download {option['name']}", key="dl_btn", use_container_width=True,
+                                         disabled=clip_error is not None)
             st.markdown('</div>', unsafe_allow_html=True)
 
-    # 8. Download Process Logic
+    # 9. Queue the download as a background job
     if download_clicked:
-        st.write("") # Spacer
-        
-        # Create a visual container for the status to live in
-        status_container = st.container()
-        
-        with status_container:
-            with st.status("🚀 Initializing download engine...", expanded=True) as status:
-                try:
-                    with tempfile.TemporaryDirectory() as tmpdir:
-                        # Progress Bar setup (using placeholder to swap later)
-                        progress_container = st.empty()
-                        progress_bar = progress_container.progress(0)
-                        progress_text = st.empty()
-                        
-                        def progress_hook(d):
-                            if d['status'] == 'downloading':
-                                try:
-                                    total = d.get('total_bytes') or d.get('total_bytes_estimate')
-                                    downloaded = d.get('downloaded_bytes', 0)
-                                    if total:
-                                        p = downloaded / total
-                                        # Update the standard progress bar
-                                        progress_bar.progress(min(p, 1.0))
-                                        
-                                        percent = f"{p*100:.1f}%"
-                                        
-                                        # Helper to remove ANSI color codes
-                                        def clean_ansi(text):
-                                            if not text: return "..."
-                                            ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-                                            return ansi_escape.sub('', str(text))
-                                            
-                                        speed = clean_ansi(d.get('_speed_str', 'N/A'))
-                                        eta = clean_ansi(d.get('_eta_str', 'N/A'))
-                                        
-                                        # Styled Progress Text
-                                        progress_text.markdown(f"""
-                                            <div style="text-align: center; font-weight: 500; color: #cbd5e1; font-size: 0.9rem; margin-top: 10px;">
-                                                <span style="color: #818cf8; font-weight: 600;">{percent}</span> completed
-                                                <span style="opacity: 0.3; margin: 0 10px;">|</span>
-                                                Speed: <span style="color: #e2e8f0;">{speed}</span>
-                                                <span style="opacity: 0.3; margin: 0 10px;">|</span>
-                                                ETA: <span style="color: #e2e8f0;">{eta}</span>
-                                            </div>
-                                        """, unsafe_allow_html=True)
-                                except: pass
-                            elif d['status'] == 'finished':
-                                progress_bar.progress(1.0)
-                                progress_text.markdown("""
-                                    <div style="text-align: center; color: #cbd5e1; font-weight: 500; margin-top: 10px;">
-                                        📥 Download finished. Preparing to merge...
-                                    </div>
-                                """, unsafe_allow_html=True)
-
-                        def post_processor_hook(d):
-                            if d['status'] == 'started':
-                                # Keep the standard progress bar (at 100%) and show styled merging text
-                                progress_bar.progress(1.0)
-                                
-                                progress_text.markdown("""
-                                    <div style="text-align: center; font-weight: 500; color: #cbd5e1; font-size: 0.9rem; margin-top: 10px;">
-                                        <span style="color: #10b981; font-weight: 600;">100%</span> completed
-                                        <span style="opacity: 0.3; margin: 0 10px;">|</span>
-                                        Status: <span style="color: #fbbf24; font-weight: 600; animation: text-pulse 1.5s infinite;">⚙️ Merging Video & Audio...</span>
-                                    </div>
-                                """, unsafe_allow_html=True)
-                            elif d['status'] == 'finished':
-                                progress_text.markdown("""
-                                    <div style="text-align: center; color: #4ade80; font-weight: 600; margin-top: 10px;">
-                                        ✨ Processing Complete!
-                                    </div>
-                                """, unsafe_allow_html=True)
-
-                        out_tmpl = os.path.join(tmpdir, '%(title)s.%(ext)s')
-                        
-                        dl_opts = {
-                            'outtmpl': out_tmpl,
-                            'quiet': True,
-                            'no_warnings': True,
-                            'restrictfilenames': True,
-                            'format': 'bestvideo+bestaudio/best', # Requests best quality
-                            'merge_output_format': 'mp4',
-                            'progress_hooks': [progress_hook],
-                            'postprocessor_hooks': [post_processor_hook],
-                        }
-
-                        if FFMPEG_PATH:
-                            dl_opts['ffmpeg_location'] = FFMPEG_PATH
-
-                        with yt_dlp.YoutubeDL(dl_opts) as ydl_down:
-                            ydl_down.download([info['url']])
-                        
-                        # Find the file
-                        files = [f for f in os.listdir(tmpdir) if os.path.isfile(os.path.join(tmpdir, f))]
-                        
-                        if files:
-                            filename = files[0]
-                            filepath = os.path.join(tmpdir, filename)
-                            
-                            with open(filepath, "rb") as f:
-                                file_data = f.read()
-                            
-                            status.update(label="✅ Ready for transfer!", state="complete", expanded=False)
-                            
-                            # Success Message
-                            st.balloons()
-                            
-                            # The actual download button that sends file to user
-                            st.markdown("###") # Spacing
-                            col_spacer, col_btn, col_spacer2 = st.columns([1, 2, 1])
-                            
-                            with col_btn:
-                                st.markdown('<div class="save-file-btn">', unsafe_allow_html=True)
-                                st.download_button(
-                                    label=f"💾 Save '{filename}' to Device",
-                                    data=file_data,
-                                    file_name=filename,
-                                    mime="video/mp4",
-                                    use_container_width=True
-                                )
-                                st.markdown('</div>', unsafe_allow_html=True)
-                        else:
-                            status.update(label="❌ Error: File not found", state="error")
-                
-                except Exception as e:
-                    status.update(label="❌ Download Failed", state="error")
-                    st.error(f"Error details: {str(e)}")
\ No newline at end of file
+        try:
+            job = get_job_queue().submit(download_job, info['url'], FFMPEG_PATH, option, label=info['title'],
+                                         owner=st.session_state.session_id)
+            st.session_state.job_id = job.id
+            # Keep the job id in the URL so a refresh re-attaches to it
+            st.query_params['job'] = job.id
+            get_memory_budget().release(st.session_state.session_id)
+        except QueueFull as e:
+            st.warning(f"🚦 {e}. Please try again in a minute.")
+
+# 10. Job Progress & Result
+# What the merge step is doing, as planned by downloader.formats
+MERGE_STATUS = {
+    'remux': "⚡ Merging Video & Audio (stream copy)...",
+    'transcode-audio': "⚙️ Merging Video & Converting Audio...",
+    'convert': "🎵 Converting Audio...",
+}
+
+def progress_html(job):
+    if job.state == QUEUED:
+        position = get_job_queue().position(job)
+        # Unknown (0) for a job queued by another app process
+        in_line = f" (#{position} in line)" if position else ""
+        return f"""
+            <div style="text-align: center; color: #cbd5e1; font-weight: 500; margin-top: 10px;">
+                ⏳ Waiting for a free download slot{in_line}...
+            </div>
+        """
+    if job.stage == 'shared':
+        return """
+            <div style="text-align: center; color: #cbd5e1; font-weight: 500; margin-top: 10px;">
+                🤝 Someone else is already fetching this video, sharing their download...
+            </div>
+        """
+    if job.stage == 'downloaded':
+        return """
+            <div style="text-align: center; color: #cbd5e1; font-weight: 500; margin-top: 10px;">
+                📥 Download finished. Preparing to merge...
+            </div>
+        """
+    if job.stage in ('merge', 'convert'):
+        # Keep the standard progress bar (at 100%) and show styled merging text
+        status_text = MERGE_STATUS.get(job.detail if job.stage == 'merge' else 'convert', "⚙️ Merging Video & Audio...")
+        return f"""
+            <div style="text-align: center; font-weight: 500; color: #cbd5e1; font-size: 0.9rem; margin-top: 10px;">
+                <span style="color: #10b981; font-weight: 600;">100%</span> completed
+                <span style="opacity: 0.3; margin: 0 10px;">|</span>
+                Status: <span style="color: #fbbf24; font-weight: 600; animation: text-pulse 1.5s infinite;">{status_text}</span>
+            </div>
+        """
+    if job.stage == 'processed':
+        return """
+            <div style="text-align: center; color: #4ade80; font-weight: 600; margin-top: 10px;">
+                ✨ Processing Complete!
+            </div>
+        """
+    if job.stage == 'export':
+        return """
+            <div style="text-align: center; color: #cbd5e1; font-weight: 500; margin-top: 10px;">
+                ☁️ Finishing the upload to storage...
+            </div>
+        """
+    # Styled Progress Text, with this download's share of the bandwidth when capped
+    limit_html = f' <span style="opacity: 0.6;">(limit {format_speed(job.rate_limit)})</span>' if job.rate_limit else ""
+    return f"""
+        <div style="text-align: center; font-weight: 500; color: #cbd5e1; font-size: 0.9rem; margin-top: 10px;">
+            <span style="color: #818cf8; font-weight: 600;">{job.progress*100:.1f}%</span> completed
+            <span style="opacity: 0.3; margin: 0 10px;">|</span>
+            Speed: <span style="color: #e2e8f0;">{format_speed(job.speed)}</span>{limit_html}
+            <span style="opacity: 0.3; margin: 0 10px;">|</span>
+            ETA: <span style="color: #e2e8f0;">{format_eta(job.eta)}</span>
+        </div>
+    """
+
+@st.fragment(run_every=PROGRESS_INTERVAL)
+def job_progress(job_id):
+    # Polls the background job; a full rerun takes over once it is done
+    job = get_job_queue().get(job_id)
+    if job is None or job.done:
+        st.rerun()
+    with st.status("🚀 Initializing download engine...", expanded=True):
+        st.progress(job.progress)
+        st.markdown(progress_html(job), unsafe_allow_html=True)
+
+def show_job_result(job):
+    if job.state == FAILED:
+        with st.status("❌ Download Failed", state="error"):
+            st.error(f"Error details: {job.error}")
+        return
+
+    delivery = get_delivery()
+    token, filename = job.result['token'], job.result['filename']
+    link = job.result.get('link')
+    filepath = delivery.store.resolve(token, filename)
+    remote_url, proxied = None, False
+    if not filepath and job.remote and job.result.get('server'):
+        # Made by another app process that does not share our data dir: send the
+        # browser to its public file server if it has one, or else pass the
+        # bytes through this process (its own address is internal)
+        if job.result.get('public_server'):
+            remote_url = job.result['public_server'] + delivery.store.url_path(token, filename)
+        else:
+            filepath = job.result['server'] + delivery.store.url_path(token, filename)
+            proxied = True
+    if not filepath and not link and not remote_url:
+        st.info("⌛ This download link has expired. Please download again.")
+        return
+
+    st.status("✅ Saved to storage!" if link else "✅ Ready for transfer!", state="complete", expanded=False)
+    
+    # Success Message (once per job, not on every rerun)
+    if st.session_state.celebrated != job.id:
+        st.session_state.celebrated = job.id
+        st.balloons()
+
+    if link:
+        # Exported to shared storage: hand out the link, the bytes never pass through here
+        st.markdown("###") # Spacing
+        if link.startswith(('http://', 'https://')):
+            st.link_button(label=f"🔗 Open '{filename}'", url=link, use_container_width=True)
+        else:
+            st.code(link, language=None)
+        return
+    if remote_url:
+        st.markdown("###") # Spacing
+        st.link_button(label=f"💾 Save '{filename}' to Device", url=remote_url, use_container_width=True)
+        return
+    
+    file_url = None if proxied else delivery.link(token, filename, host=st.context.headers.get('Host'))
+    
+    # The actual download button that sends file to user
+    st.markdown("###") # Spacing
+    col_spacer, col_btn, col_spacer2 = st.columns([1, 2, 1])
+    
+    with col_btn:
+        st.markdown('<div class="save-file-btn">', unsafe_allow_html=True)
+        save_button(job, filepath, file_url)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+def open_file(source):
+    """A finished file on disk, or on another app process's file server (a URL)."""
+    if source.startswith(('http://', 'https://')):
+        return urllib.request.urlopen(source, timeout=60)
+    return open(source, "rb")
+
+# Reruns on its own once the in-memory copy has been held long enough
+@st.fragment(run_every=INLINE_HOLD)
+def save_button(job, filepath, file_url):
+    filename, size = job.result['filename'], job.result['size']
+    label = f"💾 Save '{filename}' to Device"
+    if file_url and size > INLINE_LIMIT:
+        # Large files are streamed from disk by the file server
+        st.link_button(label=label, url=file_url, use_container_width=True)
+        return
+
+    session_id = st.session_state.session_id
+    budget = get_memory_budget()
+    if not file_url and size > budget.limit:
+        # Would never fit, so asking to try again would only loop
+        st.error("This file is too large to send through the page. Please contact the administrator.")
+        return
+    since = st.session_state.inline_since
+    if since and since[0] == job.id and time.time() - since[1] > INLINE_HOLD:
+        # Drop the in-memory copy until the user asks for it again
+        budget.release(session_id)
+        prepare = st.empty()
+        if not prepare.button("🔄 Prepare the file again", use_container_width=True):
+            return
+        prepare.empty()
+        since = st.session_state.inline_since = None
+
+    if not budget.acquire(session_id, job.id, size):
+        if file_url:
+            # Over the memory budget: stream it from disk instead
+            st.link_button(label=label, url=file_url, use_container_width=True)
+        else:
+            st.info("⏳ The server is busy handing out other files. Please try again in a moment.")
+            st.button("🔄 Try again", use_container_width=True)
+        return
+
+    # Timed: the whole file is read into memory here
+    try:
+        with get_metrics().timer('handoff', job) as record, open_file(filepath) as f:
+            data = f.read()
+            record['bytes'] = size
+    except OSError:
+        # Fetched from another app process, which is gone or has expired it
+        budget.release(session_id)
+        st.info("⌛ This download link has expired. Please download again.")
+        return
+    if not since or since[0] != job.id:
+        st.session_state.inline_since = (job.id, time.time())
+    st.download_button(
+        label=label,
+        data=data,
+        file_name=filename,
+        mime=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+        use_container_width=True
+    )
+
+current_job = get_job_queue().get(st.session_state.job_id) if st.session_state.job_id else None
+if current_job:
+    st.write("") # Spacer
+    if current_job.done:
+        show_job_result(current_job)
+    else:
+        job_progress(current_job.id)